@@ -54,9 +54,14 @@ def get_config():
 
 config = get_config()
 
+@st.cache_resource
+def get_db_helper():
+    """One DatabaseHelper per process - its Snowflake connection survives reruns"""
+    return DatabaseHelper(get_config()['snowflake_config'])
+
 try:
     pipeline = ETLMappingPipeline(config['openai_key'], config['snowflake_config'])
-    db_helper = DatabaseHelper(config['snowflake_config'])
+    db_helper = get_db_helper()
     etl_executor = ETLExecutor(config['snowflake_config'])
 except Exception as e:
     st.error(f"Failed to initialize: {e}")
@@ -456,6 +461,7 @@ if 'last_execution_summary' not in st.session_state:
                             # Execute
                             st.session_state.debug_logs.append(f"[{datetime.now()}] Calling execute_mappings()...")
                             summary = etl_executor.execute_mappings(selected_xml, xml_mappings)
+                            db_helper.invalidate_cache()  # Execution status changed
                             
                             st.session_state.debug_logs.append(f"[{datetime.now()}] Execution completed")
                             st.session_state.debug_logs.append(f"[{datetime.now()}] Summary: {summary}")
@@ -806,6 +812,7 @@ with tab3:
                 
                 # Execute
                 result = etl_executor.execute_mappings(selected_xml, xml_mappings)
+                db_helper.invalidate_cache()  # Execution status changed
                 
                 progress.progress(80)
                 st.session_state.debug_logs.append(f"[{datetime.now()}] Generation completed")
@@ -0,0 +1,22 @@
+# config/credentials.py
+"""
+Credentials and connection settings read from the environment (.env parsed once, on import)
+"""
+from types import MappingProxyType
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+
+# Snowflake connection kwargs - read-only, copy with {**SNOWFLAKE_CONFIG, ...} to override
+SNOWFLAKE_CONFIG = MappingProxyType({
+    'account': os.getenv('SF_ACCOUNT'),
+    'user': os.getenv('SF_USER'),
+    'password': os.getenv('SF_PASSWORD'),
+    'warehouse': os.getenv('SF_WAREHOUSE'),
+    'database': os.getenv('SF_DATABASE'),
+    'schema': os.getenv('SF_SCHEMA'),
+    'role': os.getenv('SF_ROLE')
+})
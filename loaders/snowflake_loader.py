@@ -1,8 +1,9 @@
 # loaders/snowflake_loader.py
 import snowflake.connector
-import json
-import xml.etree.ElementTree as ET
+import orjson
 import logging
+from utils._bulk_load import BULK_LOAD_THRESHOLD, copy_json_into
+from utils._xml_convert import xml_to_json
 
 logger = logging.getLogger(__name__)
 
@@ -38,10 +39,8 @@ class SnowflakeStageLoader:
     
     def load_xml_as_json(self, xml_path, stage_table):
         """Load XML file as JSON variant to stage table"""
-        # Parse XML and convert to JSON
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        json_data = self._xml_to_json(root)
+        # Parse XML and convert to JSON, streaming from disk
+        json_data = xml_to_json(xml_path)
         
         # Insert into Snowflake
         cursor = self.conn.cursor()
@@ -52,47 +51,20 @@ class SnowflakeStageLoader:
             )
         """)
         
-        cursor.execute(
-            f"INSERT INTO {stage_table} (xml_data) SELECT PARSE_JSON(%s)",
-            (json.dumps(json_data),)
-        )
-        
-        logger.info(f"✅ Loaded XML data to {stage_table}")
-        cursor.close()
-    
-    def _xml_to_json(self, element):
-        """Convert XML element to JSON-compatible dictionary"""
-        result = {}
-        
-        # Add attributes
-        if element.attrib:
-            result['@attributes'] = element.attrib
-        
-        # Add text content
-        if element.text and element.text.strip():
-            result['#text'] = element.text.strip()
-        
-        # Add child elements
-        children = {}
-        for child in element:
-            child_data = self._xml_to_json(child)
-            
-            if child.tag in children:
-                # Handle multiple children with same tag
-                if not isinstance(children[child.tag], list):
-                    children[child.tag] = [children[child.tag]]
-                children[child.tag].append(child_data)
+        # UTF-8 bytes - written to the stage file as-is, decoded only for a bound INSERT
+        payload = orjson.dumps(json_data)
+        try:
+            if len(payload) > BULK_LOAD_THRESHOLD:
+                copy_json_into(cursor, payload, stage_table)
             else:
-                children[child.tag] = child_data
-        
-        if children:
-            result.update(children)
-        
-        # If only text, return text directly
-        if len(result) == 1 and '#text' in result:
-            return result['#text']
+                cursor.execute(
+                    f"INSERT INTO {stage_table} (xml_data) SELECT PARSE_JSON(%s)",
+                    (payload.decode('utf-8'),)
+                )
+        finally:
+            cursor.close()
         
-        return result
+        logger.info(f"✅ Loaded XML data to {stage_table}")
     
     def test_connection(self):
         """Test Snowflake connection"""
@@ -111,6 +83,21 @@ class SnowflakeStageLoader:
             logger.error(f"❌ Connection test failed: {str(e)}")
             return False
     
+    def is_alive(self):
+        """Quiet health check - True if the connection can still run a query"""
+        try:
+            if self.conn.is_closed():
+                return False
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+    
     def close(self):
         """Close Snowflake connection"""
         if self.conn:
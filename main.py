@@ -1,7 +1,7 @@
 # main.py - UPDATED with flexible loading
 from extractors.xml_parser import XMLMetadataExtractor
 from loaders.snowflake_loader import SnowflakeStageLoader
-from mapper.openai_mapper import AIETLMapper
+from mapper.openai_mapper import AIETLMapper, MAPPING_COLUMNS
 from utils.schema_manager import SchemaManager
 from utils.product_detector import SmartProductDetector
 from utils.document_loader import SmartReferenceDataMatcher  # NEW
@@ -9,19 +9,29 @@ from utils.logging_config import setup_logging
 from utils.cost_estimator import estimate_mapping_cost
 from utils.decorators import log_execution_time
 import pandas as pd
+import numpy as np
+import asyncio
+import csv
 import os
 import logging
+import uuid
 from dotenv import load_dotenv
 from datetime import datetime
+from pathlib import Path
 
 
 load_dotenv()
 setup_logging(log_level='INFO', log_file='logs/etl_mapper.log')
 logger = logging.getLogger(__name__)
 
+# Write buffer for mapping sheets - large sheets flush in few big writes
+CSV_WRITE_BUFFER = 1 << 20
+
 
 class ETLMappingPipeline:
     def __init__(self, openai_key, snowflake_config):
+        self._openai_key = openai_key
+        self._snowflake_config = snowflake_config
         self.xml_parser = XMLMetadataExtractor()
         self.sf_loader = SnowflakeStageLoader(**snowflake_config)
         self.ai_mapper = AIETLMapper(openai_key)
@@ -114,41 +124,85 @@ class ETLMappingPipeline:
         
         # Step 7: Save results
         logger.info("💾 Saving results...")
-        self._save_results(predictions, product_code)
+        self._save_results(predictions, product_code, xml_file_path)
         
         logger.info("✅ Pipeline completed successfully!")
         return predictions
     
-    def _save_results(self, predictions, product_code: str):
+    async def run_many(self, xml_file_paths, max_concurrency=8, **run_kwargs):
+        """
+        Run the pipeline over several XML files concurrently
+        
+        Each file runs in a worker thread, so one file's OpenAI and Snowflake round trips
+        overlap with the others' instead of queueing behind them. Loaders and mappers are
+        not thread-safe, so every worker runs on its own pipeline (own Snowflake connection
+        and mapper state); all of them record usage into this pipeline's cost estimator.
+        
+        Args:
+            xml_file_paths: Paths to XML files
+            max_concurrency: Maximum files in flight at once (bounds API rate usage)
+            **run_kwargs: Passed through to run()
+        
+        Returns:
+            Results in input order - the exception instead for files that failed
+        """
+        xml_file_paths = list(xml_file_paths)
+        n_workers = max(1, min(max_concurrency, len(xml_file_paths)))
+        
+        # This pipeline plus n_workers - 1 clones - a file runs only while it holds one
+        extra = await asyncio.gather(*(asyncio.to_thread(self._clone) for _ in range(n_workers - 1)))
+        idle = asyncio.Queue()
+        for pipeline in (self, *extra):
+            idle.put_nowait(pipeline)
+        
+        async def run_one(xml_file_path):
+            pipeline = await idle.get()
+            try:
+                return await asyncio.to_thread(pipeline.run, xml_file_path, **run_kwargs)
+            finally:
+                idle.put_nowait(pipeline)
+        
+        try:
+            return await asyncio.gather(*(run_one(path) for path in xml_file_paths), return_exceptions=True)
+        finally:
+            for pipeline in extra:
+                pipeline.sf_loader.close()
+    
+    def _clone(self):
+        """Pipeline with its own connection and mapper state, tracking usage into this one's estimator"""
+        clone = ETLMappingPipeline(self._openai_key, self._snowflake_config)
+        clone.ai_mapper.cost_estimator = self.ai_mapper.cost_estimator
+        clone.ai_mapper._usage_lock = self.ai_mapper._usage_lock
+        return clone
+    
+    def _save_results(self, predictions, product_code: str, xml_file_path: str):
         """Save mapping results to output directory"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f"output/mappings_{product_code}_{timestamp}.csv"
+        # Source file stem plus a short random suffix - concurrent runs finishing in the
+        # same second must not overwrite each other's sheet
+        output_file = (f"output/mappings_{product_code}_{Path(xml_file_path).stem}_"
+                       f"{timestamp}_{uuid.uuid4().hex[:6]}.csv")
         
         os.makedirs('output', exist_ok=True)
         
-        # Convert predictions.mappings to DataFrame
-        mappings_list = []
-        for m in predictions.mappings:
-            mappings_list.append({
-                'source_node': m.source_node,
-                'target_table': m.target_table,
-                'target_column': m.target_column,
-                'transformation_logic': m.transformation_logic if m.transformation_logic else '',
-                'confidence_score': m.confidence_score,
-                'reasoning': m.reasoning
-            })
-        
-        mappings_df = pd.DataFrame(mappings_list)
-        
-        # Save to CSV
-        mappings_df.to_csv(output_file, index=False)
-        
-        logger.info(f"✅ Saved {len(mappings_df)} mappings to {output_file}")
-        
-        # Print summary (with safe access)
-        if len(mappings_df) > 0:
-            avg_conf = mappings_df['confidence_score'].mean()
-            print(f"Average confidence: {avg_conf:.1%}")
+        # Stream rows straight to CSV - no per-row dicts or intermediate DataFrame
+        mappings = predictions.mappings
+        with open(output_file, 'w', newline='', encoding='utf-8', buffering=CSV_WRITE_BUFFER) as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(MAPPING_COLUMNS)
+            writer.writerows(
+                (m.source_node, m.target_table, m.target_column,
+                 m.transformation_logic if m.transformation_logic else '',
+                 m.confidence_score, m.reasoning)
+                for m in mappings
+            )
+        
+        logger.info(f"✅ Saved {len(mappings)} mappings to {output_file}")
+        
+        # Print summary (with safe access) - one pass over the scores
+        if len(mappings) > 0:
+            scores = np.fromiter((m.confidence_score for m in mappings), dtype=np.float64, count=len(mappings))
+            print(f"Average confidence: {scores.mean():.1%}")
         
         return output_file
 
@@ -2,12 +2,21 @@
 OpenAI-powered mapping generator - WORKS WITH ANY GPT MODEL
 """
 from openai import OpenAI
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import logging
 import snowflake.connector
 import pandas as pd
 import json
+import orjson
 import re
+import threading
+import time
+from utils.cost_estimator import CostEstimator
+from utils.schema_manager import SCHEMA_CACHE_TTL
+
+# ETLMapping fields, in the column order of every generated mapping sheet
+MAPPING_COLUMNS = ('source_node', 'target_table', 'target_column',
+                   'transformation_logic', 'confidence_score', 'reasoning')
 
 try:
     from .schemas import ETLMappingResult, ETLMapping
@@ -17,6 +26,9 @@ except ImportError:
     
     @dataclass
     class ETLMapping:
+        # One instance per generated mapping - slots avoid a per-instance __dict__
+        __slots__ = MAPPING_COLUMNS
+        
         source_node: str
         target_table: str
         target_column: str
@@ -33,19 +45,63 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Silver table lists already fetched in this process, keyed by (account, role, database):
+# (fetch time, tables) - refetched after SCHEMA_CACHE_TTL so new tables show up
+_SILVER_TABLES_CACHE: Dict[tuple, Tuple[float, Dict[str, str]]] = {}
+
 
 class OpenAIMapper:
     
+    # Section keyword -> Silver table routing, built once rather than per section
+    _TABLE_ROUTING = {'policy': 'POLICY', 'account': 'ACCOUNT', 'risk': 'RISK', 'coverage': 'COVERAGE', 
+                      'payment': 'PAYMENT', 'customer': 'CUSTOMER', 'quote': 'QUOTE'}
+    
+    # First XPath segment containing a routing keyword names the node's section.
+    # All keywords go into one alternation so each path is scanned in a single pass.
+    _SECTION_RE = re.compile(
+        r'(?:^|/)([^/]*(?:' + '|'.join(map(re.escape, _TABLE_ROUTING)) + r')[^/]*)',
+        re.IGNORECASE
+    )
+    
+    # Request message shared by every section call
+    _SYSTEM_MESSAGE = {"role": "system", "content": "Return JSON only."}
+    
+    # Completion budget - ~80 output tokens per mapping, hard-capped for the response
+    _TOKENS_PER_MAPPING = 80
+    _MAX_COMPLETION_TOKENS = 4096
+    
+    # Reasoning-family models (o1, o3, o4-mini, gpt-5, ...) - no temperature override
+    _REASONING_MODEL_RE = re.compile(r'^(?:o\d|gpt-5)', re.IGNORECASE)
+    
     def __init__(self, api_key: str, model: str = "gpt-4", snowflake_config: Dict = None):
         self.client = OpenAI(api_key=api_key)
         self.model = model
         self.sf_config = snowflake_config
-        self.available_tables = self._fetch_silver_tables()
+        self._available_tables = None
+        
+        # Actual usage, read from the final chunk of each streamed completion.
+        # Models without a price entry are not costed - another model's rates and
+        # tokenizer would report numbers that are neither.
+        self.cost_estimator = CostEstimator(model) if model in CostEstimator.PRICING else None
+        if self.cost_estimator is None:
+            logger.warning(f"No pricing for model {model} - API usage will not be costed")
+        self._usage_lock = threading.Lock()
+    
+    @property
+    def available_tables(self) -> Dict[str, str]:
+        """Silver tables by name - queried from Snowflake only if no schema has supplied them"""
+        if self._available_tables is None:
+            self._available_tables = self._fetch_silver_tables()
+        return self._available_tables
     
     def _fetch_silver_tables(self) -> Dict[str, str]:
         if not self.sf_config:
             return {'POLICY': 'SILVER.POLICY', 'ACCOUNT': 'SILVER.ACCOUNT', 'RISK': 'SILVER.RISK', 
                     'COVERAGE': 'SILVER.COVERAGE', 'PAYMENT': 'SILVER.PAYMENT', 'CUSTOMER': 'SILVER.CUSTOMER', 'QUOTE': 'SILVER.QUOTE'}
+        cache_key = (self.sf_config.get('account'), self.sf_config.get('role'), self.sf_config.get('database'))
+        entry = _SILVER_TABLES_CACHE.get(cache_key)
+        if entry is not None and time.time() - entry[0] <= SCHEMA_CACHE_TTL:
+            return entry[1]
         try:
             conn = snowflake.connector.connect(**self.sf_config)
             cursor = conn.cursor()
@@ -53,8 +109,12 @@ class OpenAIMapper:
             tables = {row[0]: f"SILVER.{row[0]}" for row in cursor.fetchall()}
             cursor.close()
             conn.close()
-            return tables if tables else self._get_default_tables()
-        except:
+            if not tables:
+                return self._get_default_tables()
+            _SILVER_TABLES_CACHE[cache_key] = (time.time(), tables)
+            return tables
+        except Exception as e:
+            logger.warning(f"Could not list Silver tables, using defaults: {e}")
             return self._get_default_tables()
     
     def _get_default_tables(self) -> Dict[str, str]:
@@ -64,12 +124,21 @@ class OpenAIMapper:
     def predict_mappings_flexible(self, xml_metadata: Any, silver_schema: Any, reference_data: Dict[str, Any]) -> ETLMappingResult:
         if isinstance(silver_schema, pd.DataFrame):
             schema_dict = self._transform_schema_dataframe(silver_schema)
+            # Route against the tables already fetched by the caller instead of re-querying Snowflake
+            if 'table_name' in silver_schema.columns and not silver_schema.empty:
+                self._available_tables = {
+                    name: f"SILVER.{name}"
+                    for name in (str(t).split('.')[-1].upper() for t in silver_schema['table_name'].unique())
+                }
         else:
             schema_dict = silver_schema
         
         if isinstance(xml_metadata, pd.DataFrame):
-            nodes = [{'xpath': row.get('node_path', row.get('xpath', '')), 'data_type': row.get('data_type', 'string'), 
-                     'sample_value': row.get('sample_value', '')} for _, row in xml_metadata.iterrows()]
+            n = len(xml_metadata)
+            xpaths = self._column_values(xml_metadata, ('node_path', 'xpath'), '', n)
+            data_types = self._column_values(xml_metadata, ('data_type',), 'string', n)
+            samples = self._column_values(xml_metadata, ('sample_value',), '', n)
+            nodes = [{'xpath': x, 'data_type': d, 'sample_value': v} for x, d, v in zip(xpaths, data_types, samples)]
             xml_data = {'nodes': nodes}
         else:
             xml_data = xml_metadata
@@ -79,14 +148,25 @@ class OpenAIMapper:
     def _transform_schema_dataframe(self, df: pd.DataFrame) -> Dict[str, List[Dict]]:
         schema_dict = {}
         if 'table_name' in df.columns:
-            for table_name, group in df.groupby('table_name'):
-                columns = [{'column_name': r.get('column_name', ''), 'data_type': r.get('data_type', '')} for _, r in group.iterrows()]
+            for table_name, group in df.groupby('table_name', sort=False):
+                # Zip raw column arrays - iterrows() would box every row into a Series
+                names = self._column_values(group, ('column_name',), '', len(group))
+                types = self._column_values(group, ('data_type',), '', len(group))
+                columns = [{'column_name': c, 'data_type': t} for c, t in zip(names, types)]
                 schema_dict[table_name] = columns
                 schema_dict[table_name.upper()] = columns
                 schema_dict[f"SILVER.{table_name}"] = columns
                 schema_dict[f"SILVER.{table_name.upper()}"] = columns
         return schema_dict
     
+    @staticmethod
+    def _column_values(df: pd.DataFrame, candidates: tuple, default: Any, n: int):
+        """Values of the first candidate column present in df, or n copies of default"""
+        for column in candidates:
+            if column in df.columns:
+                return df[column].to_numpy()
+        return [default] * n
+    
     def generate_mappings(self, xml_data: Dict[str, Any], silver_schema: Dict[str, List[Dict]], reference_data: Dict[str, Any]) -> ETLMappingResult:
         nodes = xml_data.get('nodes', [])
         if not nodes:
@@ -104,23 +184,18 @@ class OpenAIMapper:
     
     def _group_nodes_by_section(self, nodes: List[Dict]) -> Dict[str, List[Dict]]:
         sections = {}
+        search = self._SECTION_RE.search
         for node in nodes:
             path = node.get('xpath', '')
             if not path:
                 continue
-            section = None
-            for part in path.split('/'):
-                if any(kw in part.lower() for kw in ['policy', 'account', 'risk', 'coverage', 'payment', 'customer', 'quote']):
-                    section = part
-                    break
-            sections.setdefault(section or 'General', []).append(node)
+            match = search(path)
+            sections.setdefault(match.group(1) if match else 'General', []).append(node)
         return sections
     
     def _determine_target_table(self, section_name: str) -> str:
         section_lower = section_name.lower()
-        routing = {'policy': 'POLICY', 'account': 'ACCOUNT', 'risk': 'RISK', 'coverage': 'COVERAGE', 
-                  'payment': 'PAYMENT', 'customer': 'CUSTOMER', 'quote': 'QUOTE'}
-        for keyword, table in routing.items():
+        for keyword, table in self._TABLE_ROUTING.items():
             if keyword in section_lower and table in self.available_tables:
                 return self.available_tables[table]
         return list(self.available_tables.values())[0] if self.available_tables else 'SILVER.POLICY'
@@ -136,31 +211,32 @@ class OpenAIMapper:
         if not target_columns:
             return []
         
-        nodes_sum = chr(10).join([f"- {n.get('xpath', 'unknown')}" for n in nodes[:20]])
-        cols_sum = chr(10).join([f"- {c['column_name']}" for c in target_columns[:20]])
+        # One bare value per line - list markers and padding only add prompt tokens
+        nodes_sum = chr(10).join([n.get('xpath', 'unknown') for n in nodes[:20]])
+        cols_sum = ','.join([c['column_name'] for c in target_columns[:20]])
         
         prompt = f"""Map XML to {target_table}. Return JSON array only.
 
-XML: {nodes_sum}
+XML:
+{nodes_sum}
 
 COLS: {cols_sum}
 
 Format: [{{"source_node":"/path","target_column":"col","transformation_logic":null,"confidence_score":0.9,"reasoning":"why"}}]"""
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "system", "content": "Return JSON only."}, {"role": "user", "content": prompt}],
-                temperature=0.2
-            )
-            
-            text = response.choices[0].message.content.strip()
-            if 'json' in text and chr(96) in text:
-                text = text.split(chr(96)*3)[1].replace('json','').strip()
+            max_tokens = min(self._MAX_COMPLETION_TOKENS, self._TOKENS_PER_MAPPING * len(nodes[:20]))
+            estimated_tokens = self._count_prompt_tokens(prompt)
+            result = self._request_section_mappings(prompt, max_tokens, estimated_tokens)
             
-            result = json.loads(text)
-            if isinstance(result, dict):
-                result = result.get('mappings', result.get('mapping', []))
+            # Output was truncated - retry once with double the budget, still within the hard cap
+            retry_tokens = min(max_tokens * 2, self._MAX_COMPLETION_TOKENS)
+            if result is None and retry_tokens > max_tokens:
+                logger.warning(f"{target_table}: completion hit max_tokens={max_tokens}, retrying with {retry_tokens}")
+                max_tokens = retry_tokens
+                result = self._request_section_mappings(prompt, max_tokens, estimated_tokens)
+            if result is None:
+                raise ValueError(f"completion truncated at max_tokens={max_tokens}")
             
             return [ETLMapping(m['source_node'], target_table, m['target_column'], 
                              m.get('transformation_logic'), float(m.get('confidence_score', 0.5)), m.get('reasoning', '')) 
@@ -168,7 +244,95 @@ Format: [{{"source_node":"/path","target_column":"col","transformation_logic":nu
         except Exception as e:
             logger.error(f"Failed: {e}")
             return []
+    
+    def _count_prompt_tokens(self, prompt: str):
+        """Local token count of the messages sent for prompt, or None if the tokenizer is unavailable"""
+        if self.cost_estimator is None:
+            return None
+        try:
+            return self.cost_estimator.count_tokens(self._SYSTEM_MESSAGE['content'] + prompt)
+        except Exception as e:
+            logger.debug(f"Skipping cost calibration - could not count prompt tokens: {e}")
+            return None
+    
+    def _request_section_mappings(self, prompt: str, max_tokens: int, estimated_tokens: int = None) -> List[Dict]:
+        """
+        Stream the completion and decode each mapping object as soon as it is complete,
+        so JSON parsing overlaps with the network instead of waiting for the full body.
+        Falls back to parsing the whole text if the stream is not a bare JSON array.
+        Returns None if the model stopped at max_tokens before closing the array.
+        estimated_tokens is the local token count of this prompt, used to calibrate the cost estimator.
+        """
+        # max_completion_tokens is accepted by every chat model (reasoning models reject
+        # max_tokens); reasoning models also only run at their default temperature
+        sampling = {} if self._REASONING_MODEL_RE.match(self.model) else {"temperature": 0.0}
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[self._SYSTEM_MESSAGE, {"role": "user", "content": prompt}],
+            max_completion_tokens=max_tokens,
+            seed=42,
+            stream=True,
+            stream_options={"include_usage": True},
+            **sampling
+        )
+        
+        decoder = json.JSONDecoder()
+        text = ''
+        pos = -1        # Offset just past the last decoded object; -1 until '[' arrives
+        closed = False
+        finish_reason = None
+        items = []
+        
+        for chunk in stream:
+            if chunk.usage is not None and self.cost_estimator is not None:
+                with self._usage_lock:
+                    self.cost_estimator.track_actual_usage(chunk, estimated_tokens)
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            if not chunk.choices[0].delta.content:
+                continue
+            text += chunk.choices[0].delta.content
+            if closed:
+                continue
+            
+            if pos < 0:
+                start = text.find('[')
+                if start < 0:
+                    continue
+                pos = start + 1
+            
+            while True:
+                while pos < len(text) and text[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos >= len(text):
+                    break
+                if text[pos] == ']':
+                    closed = True
+                    break
+                try:
+                    item, pos = decoder.raw_decode(text, pos)
+                except json.JSONDecodeError:
+                    break  # Object still arriving - wait for the next chunk
+                items.append(item)
+        
+        if closed and all(isinstance(item, dict) for item in items):
+            return items
+        if finish_reason == 'length':
+            return None
+        return self._parse_mappings_text(text)
+    
+    def _parse_mappings_text(self, text: str) -> List[Dict]:
+        """Parse a complete response body (fenced, wrapped in an object, or a bare array)"""
+        text = text.strip()
+        if 'json' in text and chr(96) in text:
+            text = text.split(chr(96)*3)[1].replace('json','').strip()
+        
+        result = orjson.loads(text)
+        if isinstance(result, dict):
+            result = result.get('mappings', result.get('mapping', []))
+        return result
 
 
-class AIETLMapper(OpenAIMapper):
-    pass
+# Name used by the pipeline and UI - the same class, not a separate subclass
+AIETLMapper = OpenAIMapper
@@ -1,10 +1,95 @@
 # mapper/similarity_engine.py
 from openai import OpenAI
+from pathlib import Path
 import numpy as np
+import hashlib
+import logging
+import orjson
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Embedding vectors keyed by model + whitespace-normalized text, optionally persisted to a directory
+    
+    On disk, index.json maps each .npy shard to the keys of its rows. Every save() appends
+    one shard holding only the vectors added since the last save, and shards are read with
+    allow_pickle=False - no code runs on load.
+    """
+    INDEX_FILE = 'index.json'
+    
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._vectors = {}
+        self._shards = {}     # Shard file name -> keys of its rows, in order
+        self._pending = []    # Keys added since the last save
+        
+        if self.path and (self.path / self.INDEX_FILE).exists():
+            try:
+                self._shards = orjson.loads((self.path / self.INDEX_FILE).read_bytes())
+                for shard, keys in self._shards.items():
+                    vectors = np.load(self.path / shard, allow_pickle=False)
+                    if len(vectors) != len(keys):
+                        raise ValueError(f"{shard} has {len(vectors)} rows for {len(keys)} keys")
+                    self._vectors.update(zip(keys, vectors))
+                logger.info(f"Loaded {len(self._vectors)} cached embeddings from {self.path}")
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable embedding cache {self.path}: {e}")
+                self._vectors, self._shards = {}, {}
+    
+    @staticmethod
+    def key(model, text):
+        """Hash key - whitespace-only edits map to the same entry"""
+        normalized = ' '.join(str(text).split())
+        return hashlib.sha256(f"{model}\0{normalized}".encode('utf-8')).hexdigest()
+    
+    def __contains__(self, key):
+        return key in self._vectors
+    
+    def __getitem__(self, key):
+        return self._vectors[key]
+    
+    def __setitem__(self, key, vector):
+        if key not in self._vectors:
+            self._pending.append(key)
+        self._vectors[key] = vector
+    
+    def save(self):
+        """Append the vectors added since the last save as one shard (no-op for in-memory caches)"""
+        if not self.path or not self._pending:
+            return
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            shard = f"shard_{uuid.uuid4().hex}.npy"
+            np.save(self.path / shard, np.stack([self._vectors[k] for k in self._pending]), allow_pickle=False)
+            self._shards[shard] = self._pending
+            
+            # Swap the index in whole, so a reader never sees a partial one
+            tmp_index = self.path / f"{self.INDEX_FILE}.{uuid.uuid4().hex}.tmp"
+            tmp_index.write_bytes(orjson.dumps(self._shards))
+            os.replace(tmp_index, self.path / self.INDEX_FILE)
+            self._pending = []
+        except Exception as e:
+            logger.warning(f"Could not write embedding cache: {e}")
+
 
 class SemanticMatcher:
-    def __init__(self, api_key):
+    # Max inputs accepted by the embeddings endpoint in a single request
+    EMBEDDING_BATCH_SIZE = 2048
+    EMBEDDING_MODEL = "text-embedding-3-small"
+    
+    def __init__(self, api_key, cache_path=None):
+        """
+        Args:
+            api_key: OpenAI API key
+            cache_path: Directory to persist embeddings in across runs, e.g. '.embed_cache'
+                (None keeps them in memory only)
+        """
         self.client = OpenAI(api_key=api_key)
+        self.cache = EmbeddingCache(cache_path)
     
     def calculate_similarity(self, source_fields, target_fields):
         """Calculate semantic similarity using embeddings"""
@@ -13,15 +98,58 @@ class SemanticMatcher:
         source_embeddings = self._get_embeddings(source_fields)
         target_embeddings = self._get_embeddings(target_fields)
         
-        # Calculate cosine similarity matrix
+        # Rows are L2-normalized float32, so a single float32 matmul (BLAS sgemm)
+        # yields the cosine similarity matrix directly
         similarity_matrix = np.dot(source_embeddings, target_embeddings.T)
         
         return similarity_matrix
     
     def _get_embeddings(self, texts):
-        """Get embeddings from OpenAI"""
-        response = self.client.embeddings.create(
-            model="text-embedding-3-small",
-            input=texts
-        )
-        return np.array([item.embedding for item in response.data])
+        """Get embeddings, reusing cached vectors and requesting only the misses"""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        keys = [self.cache.key(self.EMBEDDING_MODEL, t) for t in texts]
+        
+        # One request entry per distinct uncached text
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.cache and key not in missing:
+                missing[key] = text
+        
+        if missing:
+            fetched = self._fetch_embeddings(list(missing.values()))
+            for key, row in zip(missing, fetched):
+                self.cache[key] = row
+            self.cache.save()
+        
+        return np.stack([self.cache[key] for key in keys])
+    
+    def _fetch_embeddings(self, texts):
+        """Get embeddings from OpenAI, batching large inputs into chunked requests"""
+        embeddings = None
+        
+        for start in range(0, len(texts), self.EMBEDDING_BATCH_SIZE):
+            chunk = texts[start:start + self.EMBEDDING_BATCH_SIZE]
+            response = self.client.embeddings.create(
+                model=self.EMBEDDING_MODEL,
+                input=chunk
+            )
+            
+            # Allocate the output once the embedding width is known, then fill in place
+            if embeddings is None:
+                dim = len(response.data[0].embedding)
+                embeddings = np.empty((len(texts), dim), dtype=np.float32)
+            
+            for item in response.data:
+                embeddings[start + item.index] = item.embedding
+        
+        if embeddings is None:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        # Normalize rows in place so dot products are cosine similarities
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings /= norms
+        return embeddings
@@ -9,6 +9,47 @@ load_dotenv()
 setup_logging(log_level='INFO')
 logger = logging.getLogger(__name__)
 
+# Setup DDL, executed in order
+SETUP_STATEMENTS = (
+    # Create ETL_MAPPER and SILVER schemas
+    "CREATE SCHEMA IF NOT EXISTS ETL_MAPPER",
+    "CREATE SCHEMA IF NOT EXISTS SILVER",
+    
+    # Create stage table
+    "USE SCHEMA ETL_MAPPER",
+    """
+    CREATE TABLE IF NOT EXISTS STAGE_XML_RAW (
+        id NUMBER AUTOINCREMENT,
+        xml_data VARIANT,
+        source_file VARCHAR(500),
+        load_timestamp TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+        PRIMARY KEY (id)
+    )
+    """,
+    
+    # Create sample Silver tables for testing
+    "USE SCHEMA SILVER",
+    """
+    CREATE TABLE IF NOT EXISTS CUSTOMER (
+        customer_id NUMBER,
+        customer_name VARCHAR(200),
+        email VARCHAR(200),
+        phone VARCHAR(50),
+        created_date DATE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ORDERS (
+        order_id NUMBER,
+        customer_id NUMBER,
+        order_date DATE,
+        order_amount DECIMAL(10,2),
+        status VARCHAR(50)
+    )
+    """,
+)
+SETUP_DDL = ";\n".join(statement.strip() for statement in SETUP_STATEMENTS)
+
 def setup_snowflake_schema():
     """Create necessary schemas and tables in Snowflake"""
     
@@ -34,52 +75,10 @@ def setup_snowflake_schema():
         
         cursor = loader.conn.cursor()
         
-        # Create ETL_MAPPER schema
-        logger.info("Creating ETL_MAPPER schema...")
-        cursor.execute("CREATE SCHEMA IF NOT EXISTS ETL_MAPPER")
-        
-        # Create SILVER schema
-        logger.info("Creating SILVER schema...")
-        cursor.execute("CREATE SCHEMA IF NOT EXISTS SILVER")
-        
-        # Switch to ETL_MAPPER schema
-        cursor.execute("USE SCHEMA ETL_MAPPER")
-        
-        # Create stage table
-        logger.info("Creating stage table...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS STAGE_XML_RAW (
-                id NUMBER AUTOINCREMENT,
-                xml_data VARIANT,
-                source_file VARCHAR(500),
-                load_timestamp TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
-                PRIMARY KEY (id)
-            )
-        """)
-        
-        # Create sample Silver tables for testing
-        logger.info("Creating sample Silver layer tables...")
-        cursor.execute("USE SCHEMA SILVER")
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS CUSTOMER (
-                customer_id NUMBER,
-                customer_name VARCHAR(200),
-                email VARCHAR(200),
-                phone VARCHAR(50),
-                created_date DATE
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS ORDERS (
-                order_id NUMBER,
-                customer_id NUMBER,
-                order_date DATE,
-                order_amount DECIMAL(10,2),
-                status VARCHAR(50)
-            )
-        """)
+        # Send the whole DDL script as one multi-statement request - one round trip
+        # instead of one per statement
+        logger.info("Creating ETL_MAPPER/SILVER schemas, stage table and sample Silver tables...")
+        cursor.execute(SETUP_DDL, num_statements=len(SETUP_STATEMENTS))
         
         logger.info("✅ Snowflake setup completed successfully!")
         
@@ -1,15 +1,20 @@
 # smart_mapper_ui.py
 import streamlit as st
 import pandas as pd
+import numpy as np
+import io
 import os
 from pathlib import Path
-import xml.etree.ElementTree as ET
+from operator import attrgetter
+from lxml import etree
+import re
 from extractors.xml_parser import XMLMetadataExtractor
 from loaders.snowflake_loader import SnowflakeStageLoader
-from mapper.openai_mapper import AIETLMapper
+from mapper.openai_mapper import AIETLMapper, MAPPING_COLUMNS
 from utils.logging_config import setup_logging
 from utils.cost_estimator import estimate_mapping_cost
 from dotenv import load_dotenv
+from datetime import datetime
 import logging
 
 load_dotenv()
@@ -31,6 +36,43 @@ PRODUCT_KEYWORDS = {
     'WC001': ['WorkersComp', 'WorkersCompensation', 'Employee']
 }
 
+# Keywords lowercased once at import for case-insensitive matching
+PRODUCT_KEYWORDS_LOWER = {
+    product_code: tuple(keyword.lower() for keyword in keywords)
+    for product_code, keywords in PRODUCT_KEYWORDS.items()
+}
+
+@st.cache_resource(show_spinner=False)
+def _keyword_matcher():
+    """
+    Build the product keyword matcher - cached so Streamlit reruns of this script reuse it.
+    
+    Every keyword goes into one pattern so text is scanned once, not once per keyword.
+    The lookahead reports a match at every position (longest keyword first), and each
+    hit credits all (product, keyword) pairs it contains - e.g. 'personalauto' also
+    credits 'auto' - so scores match a per-keyword substring test. Matching is
+    case-insensitive in the regex engine, so no lowercased copy is made; credits are
+    keyed by the lowercased hit.
+    """
+    all_keywords = sorted({k for keywords in PRODUCT_KEYWORDS_LOWER.values() for k in keywords},
+                          key=len, reverse=True)
+    pattern = re.compile('(?=(' + '|'.join(map(re.escape, all_keywords)) + '))', re.IGNORECASE)
+    credits = {
+        hit: tuple((product_code, k) for product_code, keywords in PRODUCT_KEYWORDS_LOWER.items()
+                                   for k in keywords if k in hit)
+        for hit in all_keywords
+    }
+    return pattern, credits
+
+# Low-cardinality columns of the historical mapping CSVs, read as categoricals
+MAPPING_CSV_DTYPES = {'source_system': 'category', 'target_table': 'category', 'product_code': 'category'}
+
+# Mappings per page in the Review tab's detailed view
+DETAIL_PAGE_SIZE = 25
+
+# Bytes of the uploaded XML shown in the preview expander
+XML_PREVIEW_BYTES = 2000
+
 PRODUCT_NAMES = {
     'PA001': 'Personal Auto Insurance',
     'HO003': 'Homeowners Insurance',
@@ -39,20 +81,51 @@ PRODUCT_NAMES = {
     'WC001': 'Workers Compensation'
 }
 
-def detect_product_from_xml(xml_file):
+# Product selectbox options and each code's position, computed once
+PRODUCT_CODES = tuple(PRODUCT_NAMES.keys())
+PRODUCT_INDEX = {product_code: i for i, product_code in enumerate(PRODUCT_CODES)}
+
+def detect_product_from_xml(xml_bytes):
     """
-    Intelligently detect product type from XML content
+    Intelligently detect product type from raw XML bytes (in any declared encoding)
     """
     try:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        xml_content = ET.tostring(root, encoding='unicode').lower()
+        keyword_re, keyword_credits = _keyword_matcher()
+        hits = set()
+        
+        def scan(text):
+            if text:
+                hits.update(keyword_re.findall(text))
+        
+        # Stream the parse so the declared encoding is honored (e.g. UTF-16) and the
+        # declaration, comments and PIs never reach the matcher. Each element is scanned
+        # as it closes, then freed with its finished siblings - memory is bounded by depth.
+        for _, elem in etree.iterparse(io.BytesIO(xml_bytes), events=('end',), huge_tree=True,
+                                       remove_comments=True, remove_pis=True, resolve_entities=False):
+            scan(elem.tag)
+            for name, value in elem.attrib.items():
+                scan(name)
+                scan(value)
+            scan(elem.text)
+            # A child's tail is complete once the parent closes; earlier children's
+            # tails were scanned when they were pruned below
+            for child in elem:
+                scan(child.tail)
+            elem.clear(keep_tail=True)
+            
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                scan(parent[0].tail)
+                del parent[0]
+        
+        matched = set()
+        for hit in hits:
+            matched.update(keyword_credits[hit.lower()])
         
         # Score each product based on keyword matches
-        product_scores = {}
-        for product_code, keywords in PRODUCT_KEYWORDS.items():
-            score = sum(1 for keyword in keywords if keyword.lower() in xml_content)
-            product_scores[product_code] = score
+        product_scores = dict.fromkeys(PRODUCT_KEYWORDS_LOWER, 0)
+        for product_code, _ in matched:
+            product_scores[product_code] += 1
         
         # Get product with highest score
         detected_product = max(product_scores, key=product_scores.get)
@@ -63,9 +136,10 @@ def detect_product_from_xml(xml_file):
         logger.error(f"Error detecting product: {str(e)}")
         return None, 0, {}
 
+@st.cache_data(ttl=3600, show_spinner=False)
 def load_product_specific_mappings(product_code):
     """
-    Load only relevant historical mappings for detected product
+    Load only relevant historical mappings for detected product (cached across reruns)
     """
     mapping_files = {
         'PA001': 'reference_data/old_mappings_personal_auto.csv',
@@ -77,32 +151,91 @@ def load_product_specific_mappings(product_code):
     if product_code in mapping_files:
         specific_file = mapping_files[product_code]
         if os.path.exists(specific_file):
-            df = pd.read_csv(specific_file)
+            df = pd.read_csv(specific_file, dtype=MAPPING_CSV_DTYPES)
             logger.info(f"Loaded {len(df)} mappings for product {product_code}")
             return df
     
     # Fallback to combined mappings filtered by product
     if os.path.exists('reference_data/old_mappings.csv'):
-        df = pd.read_csv('reference_data/old_mappings.csv')
-        if 'product_code' in df.columns:
-            filtered = df[df['product_code'] == product_code]
-            if not filtered.empty:
+        df = load_combined_mappings()
+        if df.index.name == 'product_code':
+            if product_code in df.index:
+                filtered = df.loc[[product_code]].reset_index()
                 logger.info(f"Loaded {len(filtered)} filtered mappings for {product_code}")
                 return filtered
+            return df.reset_index()
         return df
     
     return pd.DataFrame()
 
-def save_uploaded_xml(uploaded_file, product_code):
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_combined_mappings():
     """
-    Save uploaded XML to data directory with product-specific naming
+    Load the combined historical mappings, indexed by product code so per-product
+    lookups are index hits rather than full-column comparisons (cached across reruns)
+    """
+    df = pd.read_csv('reference_data/old_mappings.csv', dtype=MAPPING_CSV_DTYPES)
+    if 'product_code' in df.columns:
+        df = df.set_index('product_code').sort_index(kind='stable')
+    return df
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_data_dictionary():
+    """
+    Load the Silver data dictionary (cached across reruns)
+    """
+    return pd.read_csv('reference_data/data_dictionary.csv')
+
+@st.cache_resource(show_spinner=False)
+def get_sf_loader(config_items):
+    """
+    Snowflake loader shared across reruns and sessions - connects once per config
+    instead of authenticating on every upload. config_items is a hashable tuple of
+    (key, value) pairs.
+    """
+    return SnowflakeStageLoader(**dict(config_items))
+
+def get_connected_sf_loader(sf_config):
+    """
+    Cached Snowflake loader for sf_config, reconnecting if the pooled connection has dropped
+    """
+    config_items = tuple(sorted(sf_config.items()))
+    sf_loader = get_sf_loader(config_items)
+    if not sf_loader.is_alive():
+        logger.warning("Cached Snowflake connection is no longer alive - reconnecting")
+        get_sf_loader.clear()
+        sf_loader = get_sf_loader(config_items)
+    return sf_loader
+
+@st.cache_data(show_spinner=False)
+def load_sample_silver_schema():
+    """
+    Sample Silver layer schema used until the UI queries Snowflake (built once, not per click)
+    """
+    return pd.DataFrame({
+        'table_name': ['SILVER.POLICY'] * 5 + ['SILVER.COVERAGE'] * 3,
+        'column_name': ['policy_id', 'policy_number', 'product_code', 'effective_date', 'premium_amount',
+                       'coverage_id', 'coverage_code', 'coverage_limit'],
+        'data_type': ['VARCHAR(50)', 'VARCHAR(100)', 'VARCHAR(50)', 'DATE', 'DECIMAL(15,2)',
+                     'VARCHAR(50)', 'VARCHAR(50)', 'DECIMAL(15,2)'],
+        'description': ['Unique policy identifier', 'Policy number', 'Product code', 'Effective date', 'Premium amount',
+                       'Coverage identifier', 'Coverage code', 'Coverage limit']
+    })
+
+def _mean_score(scores):
+    """Mean confidence score, NaN (like pandas) for an empty array without NumPy's warning"""
+    return scores.mean() if len(scores) else float('nan')
+
+def save_uploaded_xml(xml_bytes, file_name, product_code):
+    """
+    Save uploaded XML bytes to data directory with product-specific naming
     """
     os.makedirs('data/uploads', exist_ok=True)
-    timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"data/uploads/{product_code}_{timestamp}_{uploaded_file.name}"
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"data/uploads/{product_code}_{timestamp}_{file_name}"
     
     with open(filename, 'wb') as f:
-        f.write(uploaded_file.getbuffer())
+        f.write(xml_bytes)
     
     logger.info(f"Saved uploaded file to {filename}")
     return filename
@@ -144,6 +277,9 @@ with tab1:
     )
     
     if uploaded_file is not None:
+        # Read the upload once - preview, detection and save all share these bytes
+        xml_bytes = uploaded_file.getvalue()
+        
         col1, col2 = st.columns([2, 1])
         
         with col1:
@@ -153,21 +289,18 @@ with tab1:
             # Preview XML
             with st.expander("🔍 Preview XML Content"):
                 try:
-                    xml_content = uploaded_file.getvalue().decode('utf-8')
-                    st.code(xml_content[:2000] + "..." if len(xml_content) > 2000 else xml_content, language='xml')
+                    # Decode only the previewed prefix, not the whole upload
+                    xml_content = xml_bytes[:XML_PREVIEW_BYTES].decode('utf-8', errors='replace')
+                    st.code(xml_content + "..." if len(xml_bytes) > XML_PREVIEW_BYTES else xml_content, language='xml')
                 except Exception as e:
                     st.error(f"Error reading XML: {str(e)}")
         
         with col2:
             st.subheader("Product Detection")
             
-            # Reset file pointer for detection
-            uploaded_file.seek(0)
-            
             if auto_detect:
                 with st.spinner("🔍 Detecting product type..."):
-                    detected_product, confidence, scores = detect_product_from_xml(uploaded_file)
-                    uploaded_file.seek(0)  # Reset again
+                    detected_product, confidence, scores = detect_product_from_xml(xml_bytes)
                     
                     if detected_product and confidence > 0:
                         st.success(f"**Detected:** {PRODUCT_NAMES.get(detected_product, detected_product)}")
@@ -179,21 +312,21 @@ with tab1:
                         
                         selected_product = st.selectbox(
                             "Confirm or change product:",
-                            options=list(PRODUCT_NAMES.keys()),
+                            options=PRODUCT_CODES,
                             format_func=lambda x: PRODUCT_NAMES[x],
-                            index=list(PRODUCT_NAMES.keys()).index(detected_product)
+                            index=PRODUCT_INDEX[detected_product]
                         )
                     else:
                         st.warning("⚠️ Could not auto-detect product")
                         selected_product = st.selectbox(
                             "Select product manually:",
-                            options=list(PRODUCT_NAMES.keys()),
+                            options=PRODUCT_CODES,
                             format_func=lambda x: PRODUCT_NAMES[x]
                         )
             else:
                 selected_product = st.selectbox(
                     "Select product type:",
-                    options=list(PRODUCT_NAMES.keys()),
+                    options=PRODUCT_CODES,
                     format_func=lambda x: PRODUCT_NAMES[x]
                 )
         
@@ -203,8 +336,7 @@ with tab1:
         if st.button("🚀 Process and Generate Mappings", type="primary", use_container_width=True):
             
             # Save uploaded file
-            uploaded_file.seek(0)
-            saved_filepath = save_uploaded_xml(uploaded_file, selected_product)
+            saved_filepath = save_uploaded_xml(xml_bytes, uploaded_file.name, selected_product)
             
             # Create processing status
             progress_bar = st.progress(0)
@@ -217,8 +349,9 @@ with tab1:
                 
                 xml_parser = XMLMetadataExtractor()
                 xml_metadata = xml_parser.extract_schema(saved_filepath)
+                n_xml = len(xml_metadata)
                 
-                st.success(f"✅ Extracted {len(xml_metadata)} XML nodes")
+                st.success(f"✅ Extracted {n_xml} XML nodes")
                 
                 # Step 2: Load to Snowflake (40%)
                 if load_to_snowflake and snowflake_configured:
@@ -235,10 +368,10 @@ with tab1:
                         'role': os.getenv('SF_ROLE')
                     }
                     
-                    sf_loader = SnowflakeStageLoader(**sf_config)
+                    # Connection lifetime is owned by the resource cache - do not close it here
+                    sf_loader = get_connected_sf_loader(sf_config)
                     table_name = f"STAGE_XML_{selected_product}"
                     sf_loader.load_xml_as_json(saved_filepath, table_name)
-                    sf_loader.close()
                     
                     st.success(f"✅ Loaded to Snowflake table: {table_name}")
                 
@@ -247,33 +380,26 @@ with tab1:
                 progress_bar.progress(60)
                 
                 hist_mappings = load_product_specific_mappings(selected_product)
-                data_dict = pd.read_csv('reference_data/data_dictionary.csv')
+                data_dict = load_data_dictionary()
+                n_hist = len(hist_mappings)
                 
-                st.success(f"✅ Loaded {len(hist_mappings)} historical mappings for {PRODUCT_NAMES[selected_product]}")
+                st.success(f"✅ Loaded {n_hist} historical mappings for {PRODUCT_NAMES[selected_product]}")
                 
                 # Step 4: Get Silver Schema (70%)
                 status_text.text("🗄️ Fetching Silver layer schema...")
                 progress_bar.progress(70)
                 
                 # Sample schema (replace with actual Snowflake query if connected)
-                silver_schema = pd.DataFrame({
-                    'table_name': ['SILVER.POLICY'] * 5 + ['SILVER.COVERAGE'] * 3,
-                    'column_name': ['policy_id', 'policy_number', 'product_code', 'effective_date', 'premium_amount',
-                                   'coverage_id', 'coverage_code', 'coverage_limit'],
-                    'data_type': ['VARCHAR(50)', 'VARCHAR(100)', 'VARCHAR(50)', 'DATE', 'DECIMAL(15,2)',
-                                 'VARCHAR(50)', 'VARCHAR(50)', 'DECIMAL(15,2)'],
-                    'description': ['Unique policy identifier', 'Policy number', 'Product code', 'Effective date', 'Premium amount',
-                                   'Coverage identifier', 'Coverage code', 'Coverage limit']
-                })
+                silver_schema = load_sample_silver_schema()
                 
                 # Step 5: Estimate Cost (80%)
                 status_text.text("💰 Estimating AI costs...")
                 progress_bar.progress(80)
                 
                 estimated_cost = estimate_mapping_cost(
-                    len(xml_metadata),
+                    n_xml,
                     len(silver_schema),
-                    len(hist_mappings)
+                    n_hist
                 )
                 
                 st.info(f"💵 Estimated OpenAI API cost: ${estimated_cost:.4f}")
@@ -293,10 +419,17 @@ with tab1:
                     
                     # Save results
                     os.makedirs('output', exist_ok=True)
-                    output_file = f'output/mappings_{selected_product}_{pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")}.csv'
+                    output_file = f'output/mappings_{selected_product}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
                     
-                    mappings_df = pd.DataFrame([m.dict() for m in predictions.mappings])
-                    mappings_df.to_csv(output_file, index=False)
+                    # Build the frame from attribute tuples - no intermediate dict per mapping
+                    mappings_df = pd.DataFrame.from_records(
+                        map(attrgetter(*MAPPING_COLUMNS), predictions.mappings),
+                        columns=MAPPING_COLUMNS
+                    )
+                    
+                    # Serialize once - the same bytes go to disk and to the download button
+                    csv_bytes = mappings_df.to_csv(index=False).encode('utf-8')
+                    Path(output_file).write_bytes(csv_bytes)
                     
                     # Store in session state for review
                     st.session_state['mappings_df'] = mappings_df
@@ -309,20 +442,20 @@ with tab1:
                     # Display summary
                     st.success("🎉 Mapping generation complete!")
                     
+                    scores = mappings_df['confidence_score'].to_numpy()
                     col1, col2, col3 = st.columns(3)
                     with col1:
-                        st.metric("Total Mappings", len(mappings_df))
+                        st.metric("Total Mappings", len(scores))
                     with col2:
-                        st.metric("Avg Confidence", f"{mappings_df['confidence_score'].mean():.1%}")
+                        st.metric("Avg Confidence", f"{_mean_score(scores):.1%}")
                     with col3:
-                        high_conf = len(mappings_df[mappings_df['confidence_score'] >= 0.8])
-                        st.metric("High Confidence", f"{high_conf}/{len(mappings_df)}")
+                        high_conf = int((scores >= 0.8).sum())
+                        st.metric("High Confidence", f"{high_conf}/{len(scores)}")
                     
                     # Download button
-                    csv = mappings_df.to_csv(index=False).encode('utf-8')
                     st.download_button(
                         label="📥 Download Mapping Sheet (CSV)",
-                        data=csv,
+                        data=csv_bytes,
                         file_name=f"mappings_{selected_product}_{uploaded_file.name}.csv",
                         mime="text/csv",
                         use_container_width=True
@@ -348,21 +481,22 @@ with tab2:
         st.info(f"📦 Product: {PRODUCT_NAMES.get(st.session_state.get('product_code'), 'Unknown')}")
         
         # Filter options
+        unique_tables = mappings_df['target_table'].unique().tolist()
         col1, col2 = st.columns(2)
         with col1:
             min_confidence = st.slider("Minimum Confidence", 0.0, 1.0, 0.0, 0.05)
         with col2:
-            target_table = st.multiselect(
+            target_table = set(st.multiselect(
                 "Filter by Target Table",
-                options=mappings_df['target_table'].unique().tolist(),
-                default=mappings_df['target_table'].unique().tolist()
-            )
+                options=unique_tables,
+                default=unique_tables
+            ))
         
-        # Apply filters
-        filtered_df = mappings_df[
-            (mappings_df['confidence_score'] >= min_confidence) &
-            (mappings_df['target_table'].isin(target_table))
-        ]
+        # Apply filters - a single combined mask, and no table filter when every table is selected
+        mask = mappings_df['confidence_score'].to_numpy() >= min_confidence
+        if len(target_table) < len(unique_tables):
+            mask &= mappings_df['target_table'].isin(target_table).to_numpy()
+        filtered_df = mappings_df[mask]
         
         # Display mappings
         st.dataframe(
@@ -378,27 +512,41 @@ with tab2:
             }
         )
         
-        # Detailed view
+        # Detailed view - paginated so only one page of expanders/widgets is built per rerun
         st.subheader("Detailed Mapping View")
-        for idx, row in filtered_df.iterrows():
-            with st.expander(f"{row['source_node']} → {row['target_column']} ({row['confidence_score']:.1%})"):
+        n_pages = max(1, -(-len(filtered_df) // DETAIL_PAGE_SIZE))
+        # Keyed on the filters, so a filter change starts a fresh widget at page 1 instead of
+        # keeping a page number the shrunken result no longer has
+        filter_key = hash((min_confidence, tuple(sorted(target_table))))
+        page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1,
+                               key=f"detail_page_{filter_key}")
+        page = min(int(page), n_pages)
+        page_start = (page - 1) * DETAIL_PAGE_SIZE
+        page_df = filtered_df.iloc[page_start:page_start + DETAIL_PAGE_SIZE]
+        
+        # itertuples avoids boxing every row into a Series as iterrows() does
+        for row in page_df.itertuples(index=True):
+            idx = row.Index
+            with st.expander(f"{row.source_node} → {row.target_column} ({row.confidence_score:.1%})"):
                 col1, col2 = st.columns(2)
                 with col1:
                     st.write("**Source:**")
-                    st.code(row['source_node'])
-                    if pd.notna(row.get('source_attribute')):
-                        st.write(f"Attribute: `{row['source_attribute']}`")
+                    st.code(row.source_node)
+                    source_attribute = getattr(row, 'source_attribute', None)
+                    if pd.notna(source_attribute):
+                        st.write(f"Attribute: `{source_attribute}`")
                 
                 with col2:
                     st.write("**Target:**")
-                    st.code(f"{row['target_table']}.{row['target_column']}")
+                    st.code(f"{row.target_table}.{row.target_column}")
                 
-                if pd.notna(row.get('transformation_logic')):
+                transformation_logic = getattr(row, 'transformation_logic', None)
+                if pd.notna(transformation_logic):
                     st.write("**Transformation:**")
-                    st.code(row['transformation_logic'], language='sql')
+                    st.code(transformation_logic, language='sql')
                 
                 st.write("**Reasoning:**")
-                st.info(row['reasoning'])
+                st.info(row.reasoning)
                 
                 # Approval buttons
                 col1, col2, col3 = st.columns(3)
@@ -420,21 +568,26 @@ with tab3:
     if 'mappings_df' in st.session_state:
         mappings_df = st.session_state['mappings_df']
         
+        # Pull the scores out once; every statistic below is a NumPy reduction over them
+        scores = mappings_df['confidence_score'].to_numpy()
+        
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Mappings", len(mappings_df))
+            st.metric("Total Mappings", len(scores))
         with col2:
-            st.metric("Average Confidence", f"{mappings_df['confidence_score'].mean():.1%}")
+            st.metric("Average Confidence", f"{_mean_score(scores):.1%}")
         with col3:
-            high_conf = len(mappings_df[mappings_df['confidence_score'] >= 0.8])
+            high_conf = int((scores >= 0.8).sum())
             st.metric("High Confidence (≥80%)", high_conf)
         with col4:
-            low_conf = len(mappings_df[mappings_df['confidence_score'] < 0.5])
+            low_conf = int((scores < 0.5).sum())
             st.metric("Low Confidence (<50%)", low_conf)
         
         # Distribution chart
         st.subheader("Confidence Score Distribution")
-        st.bar_chart(mappings_df['confidence_score'].value_counts().sort_index())
+        # Fixed 5%-wide bins - one bar per distinct float score is unreadable for continuous values
+        counts, edges = np.histogram(scores, bins=20, range=(0, 1))
+        st.bar_chart(pd.Series(counts, index=[f"{edge:.2f}" for edge in edges[:-1]]))
         
         # Table breakdown
         st.subheader("Mappings by Target Table")
@@ -1,22 +1,10 @@
 # test_snowflake_connection.py
 from loaders.snowflake_loader import SnowflakeStageLoader
 from utils.logging_config import setup_logging
-from dotenv import load_dotenv
-import os
+from config.credentials import SNOWFLAKE_CONFIG as config
 
-load_dotenv()
 setup_logging(log_level='INFO')
 
-config = {
-    'account': os.getenv('SF_ACCOUNT'),
-    'user': os.getenv('SF_USER'),
-    'password': os.getenv('SF_PASSWORD'),
-    'warehouse': os.getenv('SF_WAREHOUSE'),
-    'database': os.getenv('SF_DATABASE'),
-    'schema': os.getenv('SF_SCHEMA'),
-    'role': os.getenv('SF_ROLE')
-}
-
 print("Testing Snowflake connection...")
 print(f"Account: {config['account']}")
 print(f"Database: {config['database']}")
@@ -0,0 +1,57 @@
+# utils/_bulk_load.py
+"""
+PUT + COPY INTO bulk loading of JSON documents into VARIANT columns
+"""
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# JSON payloads above this size are uploaded with PUT + COPY instead of a bound INSERT
+BULK_LOAD_THRESHOLD = 1 << 20
+
+# User stage every bulk XML load goes through
+XML_STAGE = '@~/xml_stage'
+
+
+def copy_json_into(cursor, payload: bytes, table: str,
+                   columns: str = 'xml_data', select: str = '$1') -> int:
+    """
+    Upload one JSON document with PUT and load it into table with COPY INTO
+
+    Args:
+        cursor: Open Snowflake cursor (the caller owns the transaction)
+        payload: UTF-8 JSON document
+        table: Target table
+        columns: Target column list
+        select: Matching select list over the staged file - $1 is the document.
+            Inlined into the COPY, so it must hold only caller-side constants
+
+    Returns:
+        Rows loaded
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix='.json')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+
+        file_name = os.path.basename(tmp_path)
+        # PUT gzips the file client-side and uploads it with parallel threads
+        cursor.execute(
+            f"PUT 'file://{Path(tmp_path).as_posix()}' {XML_STAGE} "
+            f"AUTO_COMPRESS=TRUE PARALLEL=4 OVERWRITE=TRUE"
+        )
+        cursor.execute(f"""
+            COPY INTO {table} ({columns})
+            FROM (SELECT {select} FROM {XML_STAGE}/{file_name}.gz)
+            FILE_FORMAT = (TYPE = JSON)
+            PURGE = TRUE
+        """)
+        # COPY reports one row per file: (file, status, rows_parsed, rows_loaded, ...)
+        rows_loaded = sum(row[3] for row in cursor.fetchall())
+        logger.info(f"Bulk-loaded {len(payload) / 1024:.0f} KB into {table} via {XML_STAGE}")
+        return rows_loaded
+    finally:
+        os.remove(tmp_path)
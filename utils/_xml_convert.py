@@ -0,0 +1,115 @@
+# utils/_xml_convert.py
+"""
+XML to JSON-compatible dict conversion for staging XML as VARIANT
+"""
+from typing import Any, BinaryIO, Callable, Dict, List, Tuple, Union
+from lxml import etree
+
+
+# Staged XML parse options - comments and PIs dropped so every child is an element, as with ElementTree
+_XML_PARSE_OPTIONS = dict(huge_tree=True, remove_blank_text=True,
+                          remove_comments=True, remove_pis=True)
+
+
+def _convert_streaming(source: Union[str, BinaryIO],
+                       convert: Callable[[Any, List[Tuple[str, Any]]], Any]) -> Any:
+    """
+    Convert a document bottom-up from iterparse events, without recursion
+    
+    convert(element, children) is called once per element, after all of its children,
+    with their converted (tag, value) pairs in document order. Each subtree is freed
+    as soon as it is converted, so the full DOM is never held.
+    """
+    # Converted (tag, value) children of each open element; the bottom frame receives the root
+    stack: List[List[Tuple[str, Any]]] = [[]]
+    
+    for event, element in etree.iterparse(source, events=('start', 'end'), **_XML_PARSE_OPTIONS):
+        if event == 'start':
+            stack.append([])
+            continue
+        
+        children = stack.pop()
+        stack[-1].append((element.tag, convert(element, children)))
+        
+        # Subtree is converted - release it and any earlier siblings
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+    
+    return stack[0][0][1]
+
+
+def _merge_children(result: Dict[str, Any], children: List[Tuple[str, Any]]):
+    """Add converted children to result, turning repeated tags into lists"""
+    for tag, child_data in children:
+        if tag in result:
+            # Handle multiple children with same tag
+            if not isinstance(result[tag], list):
+                result[tag] = [result[tag]]
+            result[tag].append(child_data)
+        else:
+            result[tag] = child_data
+
+
+def _to_dict(element, children: List[Tuple[str, Any]]) -> Any:
+    attrib = element.attrib
+    result = dict(attrib) if attrib else {}
+    
+    # Strip the text once and reuse it for both the test and the value
+    text = element.text
+    stripped = text.strip() if text else ''
+    if stripped:
+        if not children:  # Leaf node
+            return stripped
+        result['_text'] = stripped
+    
+    _merge_children(result, children)
+    return result if result else text
+
+
+def _to_json(element, children: List[Tuple[str, Any]]) -> Any:
+    result = {}
+    
+    attrib = element.attrib
+    if attrib:
+        result['@attributes'] = dict(attrib)
+    
+    text = element.text
+    stripped = text.strip() if text else ''
+    if stripped:
+        result['#text'] = stripped
+    
+    _merge_children(result, children)
+    
+    # If only text, return text directly
+    if len(result) == 1 and stripped:
+        return stripped
+    return result
+
+
+def xml_to_dict(source: Union[str, BinaryIO]) -> Union[Dict[str, Any], str, None]:
+    """
+    Convert an XML document (path or binary file-like) to a dictionary
+    
+    Attributes become keys, text of elements with children goes under '_text',
+    leaf elements collapse to their stripped text and repeated tags become lists.
+    
+    Returns:
+        Dict for the root element, or its text if it has no attributes or children
+    """
+    return _convert_streaming(source, _to_dict)
+
+
+def xml_to_json(source: Union[str, BinaryIO]) -> Union[Dict[str, Any], str]:
+    """
+    Convert an XML document (path or binary file-like) to a JSON-compatible dictionary
+    
+    Attributes go under '@attributes', text under '#text' and children under their tag
+    (repeated tags become lists). Elements with nothing but text collapse to the text.
+    
+    Returns:
+        Dict for the root element, or its text if that is all it has
+    """
+    return _convert_streaming(source, _to_json)
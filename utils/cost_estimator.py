@@ -2,29 +2,86 @@
 """
 Cost estimation utilities for OpenAI API usage
 """
-from typing import Dict, Optional
+from typing import Dict, Final, List, Optional
+from types import MappingProxyType
+import logging
+import os
+import threading
+import numpy as np
+import orjson
 import tiktoken
 
+logger = logging.getLogger(__name__)
+
+# BPE encodings loaded so far, by model - loading one is expensive, so do it once per process
+_ENCODING_CACHE: Dict[str, tiktoken.Encoding] = {}
+_ENCODING_LOCK = threading.Lock()
+
+
+def _get_encoding(model: str) -> tiktoken.Encoding:
+    """Return the tiktoken encoding for model, loading it on first use"""
+    encoding = _ENCODING_CACHE.get(model)
+    if encoding is None:
+        with _ENCODING_LOCK:
+            encoding = _ENCODING_CACHE.get(model)
+            if encoding is None:
+                encoding = tiktoken.encoding_for_model(model)
+                _ENCODING_CACHE[model] = encoding
+    return encoding
+
+
 class CostEstimator:
     """Estimate and track OpenAI API costs"""
     
-    # Pricing as of Oct 2025 (per 1K tokens)
-    PRICING = {
-        'gpt-4o-2024-08-06': {
+    # Fixed attribute set - no per-instance __dict__
+    __slots__ = ('model', 'total_cost', '_in_rate', '_out_rate', '_correction_factor',
+                 '_prompt_tokens', '_completion_tokens', '_call_costs', '_n_calls')
+    
+    # Pricing as of Oct 2025 (per 1K tokens) - read-only
+    PRICING: Final = MappingProxyType({
+        'gpt-4': MappingProxyType({
+            'input': 0.03,
+            'output': 0.06
+        }),
+        'gpt-4o-2024-08-06': MappingProxyType({
             'input': 0.0025,
             'output': 0.01
-        },
-        'text-embedding-3-small': {
+        }),
+        'text-embedding-3-small': MappingProxyType({
             'input': 0.00002,
             'output': 0.0
-        }
-    }
+        })
+    })
+    
+    # Model priced when none is given
+    DEFAULT_MODEL: Final = 'gpt-4o-2024-08-06'
+    
+    # Usage array slots allocated on the first tracked call, doubled as they fill
+    _INITIAL_CAPACITY: Final = 64
     
-    def __init__(self, model: str = 'gpt-4o-2024-08-06'):
+    # Default file for save_correction_factor / load_correction_factor
+    CORRECTION_FILE: Final = '.cost_correction.json'
+    # Weight of the newest observation in the correction factor's moving average
+    CORRECTION_ALPHA: Final = 0.1
+    
+    def __init__(self, model: str = DEFAULT_MODEL):
         self.model = model
-        self.encoding = tiktoken.encoding_for_model(model)
+        
+        # Per-token rates resolved once instead of on every estimate/tracked call
+        pricing = self.PRICING[model]
+        self._in_rate = pricing['input'] / 1000.0
+        self._out_rate = pricing['output'] / 1000.0
+        # Billed/locally counted prompt token ratio - kept in memory for the session
+        self._correction_factor = 1.0
+        
         self.total_cost = 0.0
-        self.call_history = []
+        
+        # Per-call usage stored column-wise, grown by doubling - far smaller than a dict per call.
+        # Allocated by the first track_actual_usage, so estimate-only instances hold no arrays.
+        self._prompt_tokens = None
+        self._completion_tokens = None
+        self._call_costs = None
+        self._n_calls = 0
     
     def estimate_cost(self, 
                      xml_metadata_size: int, 
@@ -41,54 +98,161 @@ class CostEstimator:
         Returns:
             Dictionary with cost breakdown
         """
-        # Rough token estimation
-        input_tokens = (
-            xml_metadata_size * 50 +      # ~50 tokens per XML node
-            schema_size * 40 +             # ~40 tokens per column
-            historical_mappings_size * 60 + # ~60 tokens per mapping
-            500                            # System prompt + formatting
+        batch = self.estimate_cost_batch(
+            np.array([xml_metadata_size]),
+            np.array([schema_size]),
+            np.array([historical_mappings_size])
         )
         
-        output_tokens = schema_size * 80   # ~80 tokens per predicted mapping
+        return {
+            'input_tokens': int(batch['input_tokens'][0]),
+            'output_tokens': int(batch['output_tokens'][0]),
+            'input_cost': float(batch['input_cost'][0]),
+            'output_cost': float(batch['output_cost'][0]),
+            'total_cost': float(batch['total_cost'][0]),
+            'model': self.model
+        }
+    
+    def estimate_cost_batch(self,
+                            xml_metadata_sizes: np.ndarray,
+                            schema_sizes: np.ndarray,
+                            historical_mappings_sizes: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Estimate costs for many mapping prediction calls at once (e.g. budgeting a batch of files)
+        
+        Args:
+            xml_metadata_sizes: XML node count per call
+            schema_sizes: Target column count per call
+            historical_mappings_sizes: Historical mapping row count per call
+            
+        Returns:
+            Dictionary of per-call arrays with the same keys as estimate_cost (except model)
+        """
+        xml_metadata_sizes = np.asarray(xml_metadata_sizes, dtype=np.int64)
+        schema_sizes = np.asarray(schema_sizes, dtype=np.int64)
+        historical_mappings_sizes = np.asarray(historical_mappings_sizes, dtype=np.int64)
         
-        pricing = self.PRICING[self.model]
-        input_cost = (input_tokens / 1000) * pricing['input']
-        output_cost = (output_tokens / 1000) * pricing['output']
-        total_cost = input_cost + output_cost
+        # Rough estimate scaled by the correction learned from tracked calls
+        input_tokens = np.rint(
+            self.base_input_tokens(xml_metadata_sizes, schema_sizes, historical_mappings_sizes)
+            * self._correction_factor
+        ).astype(np.int64)
+        
+        output_tokens = self.base_output_tokens(schema_sizes)
+        
+        input_cost = input_tokens * self._in_rate
+        output_cost = output_tokens * self._out_rate
         
         return {
             'input_tokens': input_tokens,
             'output_tokens': output_tokens,
             'input_cost': input_cost,
             'output_cost': output_cost,
-            'total_cost': total_cost,
-            'model': self.model
+            'total_cost': input_cost + output_cost
         }
     
+    @staticmethod
+    def base_input_tokens(xml_metadata_sizes, schema_sizes, historical_mappings_sizes):
+        """Uncorrected prompt token estimate from entity counts"""
+        return (
+            xml_metadata_sizes * 50 +      # ~50 tokens per XML node
+            schema_sizes * 40 +             # ~40 tokens per column
+            historical_mappings_sizes * 60 + # ~60 tokens per mapping
+            500                             # System prompt + formatting
+        )
+    
+    @staticmethod
+    def base_output_tokens(schema_sizes):
+        """Completion token estimate - ~80 tokens per predicted mapping"""
+        return schema_sizes * 80
+    
+    @property
+    def correction_factor(self) -> float:
+        """Current billed/estimated prompt token ratio applied to estimates"""
+        return self._correction_factor
+    
+    def load_correction_factor(self, path: Optional[str] = None) -> float:
+        """
+        Replace the correction factor with one saved by save_correction_factor
+        
+        Never called implicitly - a missing or unreadable file leaves the factor unchanged.
+        """
+        path = path or self.CORRECTION_FILE
+        try:
+            with open(path, 'rb') as f:
+                factor = float(orjson.loads(f.read())['correction_factor'])
+            if factor > 0:
+                self._correction_factor = factor
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable {path}: {e}")
+        return self._correction_factor
+    
+    def save_correction_factor(self, path: Optional[str] = None):
+        """
+        Write the correction factor to path (default CORRECTION_FILE)
+        
+        Written to a temporary file and renamed into place, so concurrent readers
+        see either the old or the new value, never a partial file.
+        """
+        path = path or self.CORRECTION_FILE
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps({'correction_factor': self._correction_factor}))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write {path}: {e}")
+    
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        """Shared BPE encoding - not loaded at all if only estimate_cost is used"""
+        return _get_encoding(self.model)
+    
     def count_tokens(self, text: str) -> int:
         """Count actual tokens in text"""
         return len(self.encoding.encode(text))
     
-    def track_actual_usage(self, response) -> Dict[str, float]:
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """Count tokens for many texts at once - encoded in parallel by tiktoken's native threads"""
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, num_threads=os.cpu_count() or 1)]
+    
+    def track_actual_usage(self, response, estimated_input_tokens: Optional[int] = None) -> Dict[str, float]:
         """
         Track actual API usage from OpenAI response
         
         Args:
             response: OpenAI API response object
+            estimated_input_tokens: Locally counted tokens of the prompt actually sent
+                (count_tokens) - when given, the in-memory correction factor moves
+                toward billed/estimated
         """
         usage = response.usage
-        pricing = self.PRICING[self.model]
         
-        input_cost = (usage.prompt_tokens / 1000) * pricing['input']
-        output_cost = (usage.completion_tokens / 1000) * pricing['output']
+        input_cost = usage.prompt_tokens * self._in_rate
+        output_cost = usage.completion_tokens * self._out_rate
         total_cost = input_cost + output_cost
         
         self.total_cost += total_cost
-        self.call_history.append({
-            'prompt_tokens': usage.prompt_tokens,
-            'completion_tokens': usage.completion_tokens,
-            'total_cost': total_cost
-        })
+        
+        n = self._n_calls
+        if self._call_costs is None:
+            self._prompt_tokens = np.empty(self._INITIAL_CAPACITY, dtype=np.int64)
+            self._completion_tokens = np.empty(self._INITIAL_CAPACITY, dtype=np.int64)
+            self._call_costs = np.empty(self._INITIAL_CAPACITY, dtype=np.float64)
+        elif n == len(self._call_costs):
+            self._prompt_tokens = np.resize(self._prompt_tokens, 2 * n)
+            self._completion_tokens = np.resize(self._completion_tokens, 2 * n)
+            self._call_costs = np.resize(self._call_costs, 2 * n)
+        self._prompt_tokens[n] = usage.prompt_tokens
+        self._completion_tokens[n] = usage.completion_tokens
+        self._call_costs[n] = total_cost
+        self._n_calls = n + 1
+        
+        if estimated_input_tokens:
+            ratio = usage.prompt_tokens / estimated_input_tokens
+            self._correction_factor += self.CORRECTION_ALPHA * (ratio - self._correction_factor)
         
         return {
             'prompt_tokens': usage.prompt_tokens,
@@ -99,12 +263,26 @@ class CostEstimator:
             'cumulative_cost': self.total_cost
         }
     
+    @property
+    def call_history(self) -> List[Dict]:
+        """Per-call usage records, built from the usage arrays on request"""
+        n = self._n_calls
+        if not n:
+            return []
+        return [
+            {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_cost': cost}
+            for prompt, completion, cost in zip(self._prompt_tokens[:n].tolist(),
+                                                self._completion_tokens[:n].tolist(),
+                                                self._call_costs[:n].tolist())
+        ]
+    
     def get_summary(self) -> Dict:
         """Get summary of all tracked costs"""
+        n = self._n_calls
         return {
-            'total_calls': len(self.call_history),
+            'total_calls': n,
             'total_cost': self.total_cost,
-            'avg_cost_per_call': self.total_cost / len(self.call_history) if self.call_history else 0,
+            'avg_cost_per_call': float(self._call_costs[:n].mean()) if n else 0,
             'call_history': self.call_history
         }
 
@@ -112,15 +290,25 @@ class CostEstimator:
 # Convenience functions for quick estimates
 def estimate_mapping_cost(num_xml_nodes: int, 
                          num_target_columns: int,
-                         num_historical_mappings: int = 50) -> float:
+                         num_historical_mappings: int = 50,
+                         estimator: Optional[CostEstimator] = None) -> float:
     """
     Quick cost estimate for mapping prediction
     
+    Without an estimator this is priced straight from the class constants at the
+    default model's rates - no instance is built. Pass an estimator to apply its
+    model and correction factor.
+    
     Usage:
         cost = estimate_mapping_cost(100, 50, 25)
         print(f"Estimated cost: ${cost:.4f}")
     """
-    estimator = CostEstimator()
+    if estimator is None:
+        pricing = CostEstimator.PRICING[CostEstimator.DEFAULT_MODEL]
+        input_tokens = CostEstimator.base_input_tokens(num_xml_nodes, num_target_columns,
+                                                       num_historical_mappings)
+        output_tokens = CostEstimator.base_output_tokens(num_target_columns)
+        return (input_tokens * pricing['input'] + output_tokens * pricing['output']) / 1000.0
     result = estimator.estimate_cost(
         num_xml_nodes,
         num_target_columns,
@@ -2,32 +2,151 @@
 Database helper functions - FINAL FIX
 """
 import snowflake.connector
+from snowflake.connector.pandas_tools import write_pandas
 import pandas as pd
+from utils._bulk_load import BULK_LOAD_THRESHOLD, copy_json_into
+from utils._xml_convert import xml_to_dict
 from datetime import datetime
-from typing import Dict
+from typing import ClassVar, Dict, Optional, Set, Tuple, Union
 import logging
-import json
+import orjson
+import re
+import time
+import io
 import os 
+import uuid
+from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# GENERATED_MAPPINGS columns written by save_mappings_to_db, in table order
+GENERATED_MAPPING_COLUMNS = ('mapping_id', 'xml_id', 'source_node', 'target_table', 'target_column',
+                             'transformation_logic', 'confidence_score', 'reasoning',
+                             'ai_generated_date', 'approval_status', 'execution_status')
+
+# Connection options applied unless the caller's config sets them: keep the session alive
+# between UI actions, download result chunks in parallel, and tag queries for tracing
+CONNECTION_DEFAULTS = {
+    'client_session_keep_alive': True,
+    'client_prefetch_threads': 8,
+    'network_timeout': 60,
+    'session_parameters': {'QUERY_TAG': 'MappingSheetGen'},
+}
+
+# Columns returned by load_approved_mappings / iter_approved_mappings
+APPROVED_MAPPING_COLUMNS = ('mapping_id', 'xml_id', 'source_node', 'target_table',
+                            'target_column', 'transformation_logic', 'confidence_score',
+                            'execution_status')
+
+# encoding="..." pseudo-attribute of a leading XML declaration
+_XML_DECL_ENCODING_RE = re.compile(r'^(\ufeff?\s*<\?xml\b[^>]*?\bencoding\s*=\s*)(["\'])[^"\']*\2')
+
+
+def _load_xml_bytes(xml_file_path: str, xml_content: Optional[Union[str, bytes]] = None) -> bytes:
+    """XML document as bytes - the caller's content if it already has it, else one read of the file"""
+    if xml_content is None:
+        return Path(xml_file_path).read_bytes()
+    if isinstance(xml_content, str):
+        # Already-decoded text is encoded as UTF-8, so the declaration must say so too -
+        # a leftover encoding="ISO-8859-1"/"UTF-16" would make the parser mis-decode it
+        xml_content = _XML_DECL_ENCODING_RE.sub(r'\1\2UTF-8\2', xml_content, count=1)
+        return xml_content.encode('utf-8')
+    return xml_content
+
+
+def _column_or_default(df: pd.DataFrame, column: str, default):
+    """Values of df[column], or default for every row if the column is absent"""
+    if column in df.columns:
+        return df[column].tolist()
+    return [default] * len(df)
+
 
 class DatabaseHelper:
     """Helper class for database operations"""
     
+    # Every table this helper touches lives here - set on the connection so SQL can use bare names
+    DATABASE = 'INSURANCE'
+    SCHEMA = 'ETL_MAPPER'
+    
+    # Tables whose CREATE TABLE IF NOT EXISTS already ran in this process
+    _schema_initialized: ClassVar[Set[str]] = set()
+    
+    # Seconds a mapping queue read is served from memory (mutations here clear it sooner)
+    READ_CACHE_TTL = 300
+    
     def __init__(self, snowflake_config: Dict):
         self.config = snowflake_config
+        self._conn = None
+        self._read_cache: Dict[str, Tuple[float, pd.DataFrame]] = {}
     
     def get_connection(self):
-        """Get Snowflake connection"""
-        return snowflake.connector.connect(**self.config)
+        """Get the Snowflake connection - opened on first use and reused by every method"""
+        if self._conn is None or self._conn.is_closed():
+            self._conn = self._connect()
+        return self._conn
+    
+    def _connect(self):
+        """Open a new connection with this helper's settings"""
+        return snowflake.connector.connect(**{
+            **CONNECTION_DEFAULTS, **self.config,
+            'database': self.DATABASE, 'schema': self.SCHEMA
+        })
+    
+    def close(self):
+        """Close the shared connection"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    def invalidate_cache(self):
+        """Drop cached mapping reads - call after GENERATED_MAPPINGS is changed elsewhere"""
+        self._read_cache.clear()
+    
+    def _cached_read(self, key: str) -> Optional[pd.DataFrame]:
+        """Copy of a read cached within READ_CACHE_TTL, or None"""
+        entry = self._read_cache.get(key)
+        if entry is None:
+            return None
+        fetched_at, df = entry
+        if time.time() - fetched_at > self.READ_CACHE_TTL:
+            # pop - the helper is shared across sessions, which may evict the same entry
+            self._read_cache.pop(key, None)
+            return None
+        return df.copy()
+    
+    def _remember_read(self, key: str, df: pd.DataFrame) -> pd.DataFrame:
+        self._read_cache[key] = (time.time(), df)
+        return df.copy()
+    
+    def _ensure_table(self, cursor, table: str, ddl: str):
+        """Run a table's CREATE TABLE IF NOT EXISTS once per process instead of on every save"""
+        if table not in DatabaseHelper._schema_initialized:
+            cursor.execute(ddl)
+            DatabaseHelper._schema_initialized.add(table)
+    
+    def _fetch_frame(self, query: str, params=None) -> pd.DataFrame:
+        """Run a query and fetch the result as Arrow batches straight into a DataFrame"""
+        cursor = self.get_connection().cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetch_pandas_all()
+        finally:
+            cursor.close()
     
     # utils/database_helper.py - Add/Update these methods
 
-    def save_xml_to_stage(self, xml_file_path: str, xml_content: str, 
+    def save_xml_to_stage(self, xml_file_path: str, xml_content: Optional[Union[str, bytes]], 
                         product_code: str, uploaded_by: str) -> str:
         """
         Save XML to database AND load into staging table with VARIANT
+        
+        xml_content may be None, in which case the file is read here once.
         """
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -37,14 +156,14 @@ class DatabaseHelper:
             
             # 1. Save XML metadata
             cursor.execute("""
-                INSERT INTO INSURANCE.ETL_MAPPER.XML_FILES
+                INSERT INTO XML_FILES
                 (xml_id, file_name, file_path, product_code, uploaded_by, upload_date)
                 VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP())
             """, (xml_id, os.path.basename(xml_file_path), xml_file_path, product_code, uploaded_by))
             
             # 2. ✅ Create staging table if not exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS INSURANCE.ETL_MAPPER.XML_STAGING (
+            self._ensure_table(cursor, 'XML_STAGING', """
+                CREATE TABLE IF NOT EXISTS XML_STAGING (
                     staging_id VARCHAR(50) PRIMARY KEY DEFAULT UUID_STRING(),
                     xml_id VARCHAR(50) NOT NULL,
                     xml_data VARIANT,
@@ -56,50 +175,23 @@ class DatabaseHelper:
             """)
             
             # 3. ✅ Parse and load XML into staging as VARIANT
-            # Parse XML to JSON-like structure
-            import xml.etree.ElementTree as ET
-            
-            root = ET.fromstring(xml_content)
-            
             # Convert XML to dict/JSON structure
-            def xml_to_dict(element):
-                """Convert XML element to dictionary"""
-                result = {}
-                
-                # Add attributes
-                if element.attrib:
-                    result.update(element.attrib)
-                
-                # Add text content
-                if element.text and element.text.strip():
-                    if len(element) == 0:  # Leaf node
-                        return element.text.strip()
-                    result['_text'] = element.text.strip()
-                
-                # Add children
-                for child in element:
-                    child_data = xml_to_dict(child)
-                    if child.tag in result:
-                        # Handle multiple children with same tag
-                        if not isinstance(result[child.tag], list):
-                            result[child.tag] = [result[child.tag]]
-                        result[child.tag].append(child_data)
-                    else:
-                        result[child.tag] = child_data
-                
-                return result if result else element.text
+            xml_dict = xml_to_dict(io.BytesIO(_load_xml_bytes(xml_file_path, xml_content)))
             
-            xml_dict = xml_to_dict(root)
+            # 4. ✅ Insert parsed XML as VARIANT - large documents go through the stage
+            xml_json = orjson.dumps(xml_dict)
             
-            # 4. ✅ Insert parsed XML as VARIANT (JSON string)
-            import json
-            xml_json = json.dumps(xml_dict)
-            
-            cursor.execute("""
-                INSERT INTO INSURANCE.ETL_MAPPER.XML_STAGING
-                (xml_id, xml_data, target_table, processed)
-                VALUES (%s, PARSE_JSON(%s), %s, FALSE)
-            """, (xml_id, xml_json, 'UNKNOWN'))
+            if len(xml_json) > BULK_LOAD_THRESHOLD:
+                # xml_id is generated here (XML-<timestamp>), so it is safe to inline
+                copy_json_into(cursor, xml_json, 'XML_STAGING',
+                               columns='xml_id, xml_data, target_table, processed',
+                               select=f"'{xml_id}', $1, 'UNKNOWN', FALSE")
+            else:
+                cursor.execute("""
+                    INSERT INTO XML_STAGING
+                    (xml_id, xml_data, target_table, processed)
+                    VALUES (%s, PARSE_JSON(%s), %s, FALSE)
+                """, (xml_id, xml_json.decode('utf-8'), 'UNKNOWN'))
             
             logger.info(f"✅ XML loaded into staging: {xml_id}")
             
@@ -112,7 +204,6 @@ class DatabaseHelper:
             raise
         finally:
             cursor.close()
-            conn.close()
 
     
     def save_mappings_to_db(self, xml_id: str, mappings_result) -> int:
@@ -121,18 +212,10 @@ class DatabaseHelper:
         cursor = conn.cursor()
         
         try:
-            count = 0
-            for mapping in mappings_result.mappings:
-                mapping_id = f"MAP-{xml_id}-{count:04d}"
-                
-                cursor.execute("""
-                    INSERT INTO INSURANCE.ETL_MAPPER.GENERATED_MAPPINGS
-                    (mapping_id, xml_id, source_node, target_table, target_column,
-                     transformation_logic, confidence_score, reasoning,
-                     ai_generated_date, approval_status, execution_status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    mapping_id,
+            generated_date = datetime.now()
+            rows = [
+                (
+                    f"MAP-{xml_id}-{i:04d}",
                     xml_id,
                     mapping.source_node,
                     mapping.target_table,
@@ -140,13 +223,22 @@ class DatabaseHelper:
                     mapping.transformation_logic or '',
                     mapping.confidence_score,
                     mapping.reasoning,
-                    datetime.now(),
+                    generated_date,
                     'Pending',
                     'Not Started'
-                ))
-                count += 1
+                )
+                for i, mapping in enumerate(mappings_result.mappings)
+            ]
+            
+            # Bulk load - write_pandas stages the rows as Parquet and runs a single COPY INTO
+            if rows:
+                df = pd.DataFrame.from_records(rows, columns=GENERATED_MAPPING_COLUMNS)
+                write_pandas(conn, df, 'GENERATED_MAPPINGS', database=self.DATABASE, schema=self.SCHEMA,
+                             quote_identifiers=False, chunk_size=16000, use_logical_type=True)
+            count = len(rows)
             
             conn.commit()
+            self.invalidate_cache()
             logger.info(f"✅ Saved {count} mappings")
             return count
             
@@ -156,28 +248,27 @@ class DatabaseHelper:
             raise
         finally:
             cursor.close()
-            conn.close()
     
     def load_pending_mappings(self) -> pd.DataFrame:
         """Load mappings with Pending approval status"""
-        conn = self.get_connection()
+        cached = self._cached_read('pending')
+        if cached is not None:
+            return cached
         try:
             query = """
                 SELECT mapping_id, xml_id, source_node, target_table, target_column,
-                       transformation_logic, confidence_score, reasoning, 
+                       transformation_logic, confidence_score::FLOAT AS confidence_score, reasoning, 
                        approval_status, user_notes
-                FROM INSURANCE.ETL_MAPPER.GENERATED_MAPPINGS
+                FROM GENERATED_MAPPINGS
                 WHERE approval_status = 'Pending'
                 ORDER BY xml_id, confidence_score DESC
             """
-            df = pd.read_sql(query, conn)
+            df = self._fetch_frame(query)
             df.columns = df.columns.str.lower()  # Fix uppercase column names
-            return df
+            return self._remember_read('pending', df)
         except Exception as e:
             logger.error(f"Error: {e}")
             return pd.DataFrame()
-        finally:
-            conn.close()
     
     # def load_approved_mappings(self) -> pd.DataFrame:
     #     conn = self.get_connection()
@@ -185,7 +276,7 @@ class DatabaseHelper:
     #         query = """
     #             SELECT mapping_id, xml_id, source_node, target_table, target_column,
     #                    transformation_logic, confidence_score, execution_status
-    #             FROM INSURANCE.ETL_MAPPER.GENERATED_MAPPINGS
+    #             FROM GENERATED_MAPPINGS
     #             WHERE approval_status = 'Approved'
     #               AND execution_status IN ('Not Started', 'Failed')
     #             ORDER BY xml_id
@@ -197,32 +288,46 @@ class DatabaseHelper:
     #     finally:
     #         conn.close()
 
-    def load_approved_mappings(self) -> pd.DataFrame:
-        """Load approved mappings using Snowflake's native pandas support"""
-        conn = self.get_connection()
+    def iter_approved_mappings(self):
+        """
+        Yield approved mappings awaiting execution as DataFrame batches
+        
+        Batches are Arrow result chunks from fetch_pandas_batches, so only one
+        is held in memory at a time. Column names are lowercased.
+        confidence_score is cast to FLOAT server-side so it arrives as float64, not Decimal objects.
+        """
+        query = """
+            SELECT mapping_id, xml_id, source_node, target_table, target_column,
+                transformation_logic, confidence_score::FLOAT AS confidence_score, execution_status
+            FROM GENERATED_MAPPINGS
+            WHERE approval_status = 'Approved'
+            AND execution_status IN ('Not Started', 'Failed')
+            ORDER BY xml_id
+        """
+        cursor = self.get_connection().cursor()
         try:
-            query = """
-                SELECT mapping_id, xml_id, source_node, target_table, target_column,
-                    transformation_logic, confidence_score, execution_status
-                FROM INSURANCE.ETL_MAPPER.GENERATED_MAPPINGS
-                WHERE approval_status = 'Approved'
-                AND execution_status IN ('Not Started', 'Failed')
-                ORDER BY xml_id
-            """
-            
-            # ✅ Use Snowflake's native fetch_pandas_all() method
-            cursor = conn.cursor()
             cursor.execute(query)
-            df = cursor.fetch_pandas_all()
+            for batch in cursor.fetch_pandas_batches():
+                batch.columns = batch.columns.str.lower()
+                yield batch
+        finally:
             cursor.close()
-            
-            # ✅ Normalize column names to lowercase
-            df.columns = df.columns.str.lower()
+    
+    def load_approved_mappings(self) -> pd.DataFrame:
+        """Load approved mappings using Snowflake's native pandas support"""
+        cached = self._cached_read('approved')
+        if cached is not None:
+            return cached
+        try:
+            batches = list(self.iter_approved_mappings())
+            if not batches:
+                return pd.DataFrame(columns=list(APPROVED_MAPPING_COLUMNS))
+            df = pd.concat(batches, ignore_index=True)
             
             logger.info(f"Loaded {len(df)} approved mappings")
             logger.debug(f"Columns: {df.columns.tolist()}")
             
-            return df
+            return self._remember_read('approved', df)
             
         except Exception as e:
             logger.error(f"Error loading approved mappings: {e}")
@@ -230,104 +335,120 @@ class DatabaseHelper:
             logger.error(traceback.format_exc())
             
             # Return empty DataFrame with correct structure
-            return pd.DataFrame(columns=[
-                'mapping_id', 'xml_id', 'source_node', 'target_table', 
-                'target_column', 'transformation_logic', 'confidence_score', 
-                'execution_status'
-            ])
-        finally:
-            conn.close()
+            return pd.DataFrame(columns=list(APPROVED_MAPPING_COLUMNS))
 
     
     def approve_mappings(self, xml_id: str, mappings_df: pd.DataFrame, approved_by: str = "system") -> int:
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            count = 0
-            for _, row in mappings_df.iterrows():
-                cursor.execute("""
-                    UPDATE INSURANCE.ETL_MAPPER.GENERATED_MAPPINGS
-                    SET approval_status = 'Approved', approved_by = %s, approved_date = %s,
-                        transformation_logic = %s, user_notes = %s
-                    WHERE mapping_id = %s
-                """, (approved_by, datetime.now(), row.get('transformation_logic', ''), 
-                     row.get('user_notes', ''), row['mapping_id']))
-                count += 1
-            conn.commit()
-            return count
-        finally:
-            cursor.close()
-            conn.close()
+        if mappings_df is None or mappings_df.empty:
+            return 0
+        return self._merge_mapping_edits(
+            mappings_df,
+            "t.approval_status = 'Approved', t.approved_by = %s, t.approved_date = %s,",
+            (approved_by, datetime.now())
+        )
     
     def reject_mappings(self, xml_id: str) -> int:
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("UPDATE INSURANCE.ETL_MAPPER.GENERATED_MAPPINGS SET approval_status = 'Rejected' WHERE xml_id = %s", (xml_id,))
+            cursor.execute("UPDATE GENERATED_MAPPINGS SET approval_status = 'Rejected' WHERE xml_id = %s", (xml_id,))
             count = cursor.rowcount
             conn.commit()
+            self.invalidate_cache()
             return count
         finally:
             cursor.close()
-            conn.close()
     
     def update_mappings(self, xml_id: str, mappings_df: pd.DataFrame) -> int:
-        conn = self.get_connection()
+        if mappings_df is None or mappings_df.empty:
+            return 0
+        return self._merge_mapping_edits(mappings_df)
+    
+    def _merge_mapping_edits(self, mappings_df: pd.DataFrame, extra_set: str = '', params: tuple = ()) -> int:
+        """
+        Apply edited transformation_logic / user_notes from mappings_df in one MERGE
+        
+        The edits are bulk-loaded into a temporary table, so GENERATED_MAPPINGS is
+        scanned once however many rows changed. extra_set is prepended to the SET list
+        with params bound to its placeholders. Returns the number of rows updated.
+        
+        Runs on its own short-lived connection: the shared one may be serving other
+        Streamlit sessions, and its commit/rollback would end their transactions too.
+        The temporary table goes away with that session.
+        """
+        # Last edit wins - a mapping_id matched twice makes the MERGE nondeterministic
+        edits_src = mappings_df.drop_duplicates('mapping_id', keep='last')
+        edits = pd.DataFrame({
+            'mapping_id': edits_src['mapping_id'].tolist(),
+            'transformation_logic': _column_or_default(edits_src, 'transformation_logic', ''),
+            'user_notes': _column_or_default(edits_src, 'user_notes', ''),
+        })
+        
+        conn = self._connect()
         cursor = conn.cursor()
+        edits_table = f"TMP_MAPPING_EDITS_{uuid.uuid4().hex[:12].upper()}"
         try:
-            count = 0
-            for _, row in mappings_df.iterrows():
-                cursor.execute("""
-                    UPDATE INSURANCE.ETL_MAPPER.GENERATED_MAPPINGS
-                    SET transformation_logic = %s, user_notes = %s
-                    WHERE mapping_id = %s
-                """, (row.get('transformation_logic', ''), row.get('user_notes', ''), row['mapping_id']))
-                count += 1
+            # Column types copied from the target - inferring them from the frame turns an
+            # all-None column (e.g. no reviewer notes) into one the typed MERGE can't assign
+            cursor.execute(f"""
+                CREATE TEMPORARY TABLE {edits_table} AS
+                SELECT mapping_id, transformation_logic, user_notes FROM GENERATED_MAPPINGS WHERE FALSE
+            """)
+            write_pandas(conn, edits, edits_table, quote_identifiers=False, use_logical_type=True)
+            
+            cursor.execute("BEGIN")
+            cursor.execute(f"""
+                MERGE INTO GENERATED_MAPPINGS t
+                USING {edits_table} s
+                ON t.mapping_id = s.mapping_id
+                WHEN MATCHED THEN UPDATE SET {extra_set}
+                    t.transformation_logic = s.transformation_logic, t.user_notes = s.user_notes
+            """, params or None)
+            updated = cursor.rowcount
             conn.commit()
-            return count
+            self.invalidate_cache()
+            return updated
+        except Exception:
+            conn.rollback()
+            raise
         finally:
-            cursor.close()
-            conn.close()
+            # Best effort - a failed close must not mask the real error
+            try:
+                cursor.close()
+                conn.close()
+            except Exception as e:
+                logger.warning(f"Could not close mapping edit session: {e}")
     
     def load_execution_history(self, limit: int = 10) -> pd.DataFrame:
-        conn = self.get_connection()
         try:
-            query = f"""
+            query = """
                 SELECT execution_id, xml_id, target_table, execution_start, execution_end,
                        rows_processed, rows_inserted, rows_failed, execution_status, executed_by
-                FROM INSURANCE.ETL_MAPPER.ETL_EXECUTION_LOG
-                ORDER BY execution_start DESC LIMIT {limit}
+                FROM ETL_EXECUTION_LOG
+                ORDER BY execution_start DESC LIMIT %s
             """
-            return pd.read_sql(query, conn)
+            return self._fetch_frame(query, (limit,))
         except:
             return pd.DataFrame()
-        finally:
-            conn.close()
     
     def load_reconciliation_results(self, limit: int = 10) -> pd.DataFrame:
-        conn = self.get_connection()
         try:
-            query = f"""
+            query = """
                 SELECT recon_id, execution_id, source_count, target_count, match_count,
                        mismatch_count, missing_in_target, extra_in_target, 
                        reconciliation_status, details, created_timestamp
-                FROM INSURANCE.ETL_MAPPER.RECONCILIATION_RESULTS
-                ORDER BY created_timestamp DESC LIMIT {limit}
+                FROM RECONCILIATION_RESULTS
+                ORDER BY created_timestamp DESC LIMIT %s
             """
-            return pd.read_sql(query, conn)
+            return self._fetch_frame(query, (limit,))
         except:
             return pd.DataFrame()
-        finally:
-            conn.close()
 
     def save_xml_to_stage_with_copy(self, xml_file_path: str, product_code: str, 
                                     uploaded_by: str) -> str:
         """
         Load XML and parse into VARIANT - FIXED for large JSON
         """
-        import xml.etree.ElementTree as ET
-        import json
-        
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -335,8 +456,8 @@ class DatabaseHelper:
             xml_id = f"XML-{datetime.now().strftime('%Y%m%d%H%M%S')}"
             
             # 1. Create staging table if not exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS INSURANCE.ETL_MAPPER.XML_STAGING (
+            self._ensure_table(cursor, 'XML_STAGING', """
+                CREATE TABLE IF NOT EXISTS XML_STAGING (
                     staging_id VARCHAR(50) DEFAULT UUID_STRING(),
                     xml_id VARCHAR(50) NOT NULL,
                     xml_data VARIANT,
@@ -347,47 +468,9 @@ class DatabaseHelper:
                 )
             """)
             
-            # 2. Parse XML file
-            with open(xml_file_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-            
-            root = ET.fromstring(xml_content)
-            
-            # 3. Convert XML to dict
-            def xml_to_dict(element):
-                result = {}
-                if element.attrib:
-                    result.update(element.attrib)
-                if element.text and element.text.strip():
-                    if len(element) == 0:
-                        return element.text.strip()
-                    result['_text'] = element.text.strip()
-                for child in element:
-                    child_data = xml_to_dict(child)
-                    if child.tag in result:
-                        if not isinstance(result[child.tag], list):
-                            result[child.tag] = [result[child.tag]]
-                        result[child.tag].append(child_data)
-                    else:
-                        result[child.tag] = child_data
-                return result if result else element.text
-            
-            xml_dict = xml_to_dict(root)
-            xml_json = json.dumps(xml_dict)
-            
-            # 4. ✅ Insert using parameter binding (FIXED - handles large strings)
-            cursor.execute("""
-                INSERT INTO INSURANCE.ETL_MAPPER.XML_STAGING
-                (xml_id, xml_data, processed)
-                SELECT %s, PARSE_JSON(%s), FALSE
-            """, (xml_id, xml_json))
-            
-            rows_inserted = cursor.rowcount
-            logger.info(f"✅ Loaded {rows_inserted} row(s) of XML into staging for {xml_id}")
-            
-            # 5. Save metadata
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS INSURANCE.ETL_MAPPER.XML_FILES (
+            # 2. Create metadata table if not exists
+            self._ensure_table(cursor, 'XML_FILES', """
+                CREATE TABLE IF NOT EXISTS XML_FILES (
                     xml_id VARCHAR(50) PRIMARY KEY,
                     file_name VARCHAR(500),
                     file_path VARCHAR(1000),
@@ -397,11 +480,36 @@ class DatabaseHelper:
                 )
             """)
             
-            cursor.execute("""
-                INSERT INTO INSURANCE.ETL_MAPPER.XML_FILES
-                (xml_id, file_name, file_path, product_code, uploaded_by, upload_date)
-                VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP())
-            """, (xml_id, os.path.basename(xml_file_path), xml_file_path, product_code, uploaded_by))
+            # 3. Parse XML file and convert to dict, streaming from disk
+            xml_dict = xml_to_dict(xml_file_path)
+            xml_json = orjson.dumps(xml_dict)
+            file_meta = (os.path.basename(xml_file_path), xml_file_path, product_code, uploaded_by)
+            
+            # 4. ✅ Large documents go through the stage - a bound parameter has a size cap
+            if len(xml_json) > BULK_LOAD_THRESHOLD:
+                # xml_id is generated here (XML-<timestamp>), so it is safe to inline
+                rows_inserted = copy_json_into(cursor, xml_json, 'XML_STAGING',
+                                               columns='xml_id, xml_data, processed',
+                                               select=f"'{xml_id}', $1, FALSE")
+                cursor.execute("""
+                    INSERT INTO XML_FILES
+                    (xml_id, file_name, file_path, product_code, uploaded_by, upload_date)
+                    VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP())
+                """, (xml_id, *file_meta))
+            else:
+                # Data and metadata rows in one multi-table INSERT - a single round trip
+                cursor.execute("""
+                    INSERT ALL
+                        INTO XML_STAGING (xml_id, xml_data, processed)
+                            VALUES (xml_id, xml_data, processed)
+                        INTO XML_FILES (xml_id, file_name, file_path, product_code, uploaded_by, upload_date)
+                            VALUES (xml_id, file_name, file_path, product_code, uploaded_by, upload_date)
+                    SELECT %s AS xml_id, PARSE_JSON(%s) AS xml_data, FALSE AS processed,
+                           %s AS file_name, %s AS file_path, %s AS product_code, %s AS uploaded_by,
+                           CURRENT_TIMESTAMP() AS upload_date
+                """, (xml_id, xml_json.decode('utf-8'), *file_meta))
+                rows_inserted = 1
+            logger.info(f"✅ Loaded {rows_inserted} row(s) of XML into staging for {xml_id}")
             
             conn.commit()
             logger.info(f"✅ XML metadata saved for {xml_id}")
@@ -416,7 +524,6 @@ class DatabaseHelper:
             raise
         finally:
             cursor.close()
-            conn.close()
 
     def save_xml_raw_bronze(self, xml_file_path: str, product_code: str, 
                         uploaded_by: str) -> str:
@@ -430,8 +537,8 @@ class DatabaseHelper:
             xml_id = f"XML-{datetime.now().strftime('%Y%m%d%H%M%S')}"
             
             # Create Bronze table for raw XML
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS INSURANCE.ETL_MAPPER.XML_RAW_BRONZE (
+            self._ensure_table(cursor, 'XML_RAW_BRONZE', """
+                CREATE TABLE IF NOT EXISTS XML_RAW_BRONZE (
                     xml_id VARCHAR(50) PRIMARY KEY,
                     file_name VARCHAR(500),
                     raw_xml TEXT,
@@ -442,18 +549,20 @@ class DatabaseHelper:
                 )
             """)
             
-            # Read raw XML
-            with open(xml_file_path, 'r', encoding='utf-8') as f:
+            # Read raw XML - text mode, so \r\n is normalized to \n as before
+            with open(xml_file_path, 'r', encoding='utf-8', newline=None) as f:
                 raw_xml = f.read()
             
             file_name = os.path.basename(xml_file_path)
             
-            # Insert raw XML and parsed VARIANT
+            # Insert raw XML and parsed VARIANT - the document is bound once and parsed server-side
             cursor.execute("""
-                INSERT INTO INSURANCE.ETL_MAPPER.XML_RAW_BRONZE
+                INSERT INTO XML_RAW_BRONZE
                 (xml_id, file_name, raw_xml, xml_variant, product_code, uploaded_by)
-                SELECT %s, %s, %s, PARSE_XML(%s), %s, %s
-            """, (xml_id, file_name, raw_xml, raw_xml, product_code, uploaded_by))
+                SELECT xml_id, file_name, raw_xml, PARSE_XML(raw_xml), product_code, uploaded_by
+                FROM (SELECT %s AS xml_id, %s AS file_name, %s AS raw_xml,
+                             %s AS product_code, %s AS uploaded_by)
+            """, (xml_id, file_name, raw_xml, product_code, uploaded_by))
             
             logger.info(f"✅ Stored raw XML in Bronze: {xml_id}")
             
@@ -466,4 +575,3 @@ class DatabaseHelper:
             raise
         finally:
             cursor.close()
-            conn.close()
@@ -3,6 +3,8 @@
 Reusable decorators for error handling, retries, and logging
 """
 import functools
+import inspect
+import random
 import time
 import logging
 from typing import Callable, Optional, Type, Tuple
@@ -11,18 +13,35 @@ from openai import OpenAIError, RateLimitError, APIConnectionError
 logger = logging.getLogger(__name__)
 
 
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After header (seconds) of an HTTP error response, if present"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
 def retry_on_error(max_retries: int = 3, 
                    delay: float = 1.0,
                    backoff_factor: float = 2.0,
-                   exceptions: Tuple[Type[Exception], ...] = (Exception,)):
+                   exceptions: Tuple[Type[Exception], ...] = (Exception,),
+                   max_delay: float = 60.0,
+                   jitter: bool = True):
     """
-    Retry decorator with exponential backoff
+    Retry decorator with capped exponential backoff
     
     Args:
         max_retries: Maximum number of retry attempts
         delay: Initial delay between retries (seconds)
         backoff_factor: Multiplier for delay after each retry
         exceptions: Tuple of exception types to catch
+        max_delay: Upper bound on any single wait (seconds)
+        jitter: Sleep a random time up to the backoff delay, so concurrent
+            callers hitting the same rate limit don't retry in lockstep
         
     Usage:
         @retry_on_error(max_retries=3, delay=2)
@@ -42,11 +61,20 @@ def retry_on_error(max_retries: int = 3,
                 except exceptions as e:
                     last_exception = e
                     if attempt < max_retries:
+                        sleep_for = min(current_delay, max_delay)
+                        if jitter:
+                            sleep_for = random.uniform(0, sleep_for)
+                        
+                        # Honor the server's Retry-After hint when it asks for longer
+                        retry_after = _retry_after_seconds(e)
+                        if retry_after is not None:
+                            sleep_for = min(max(sleep_for, retry_after), max_delay)
+                        
                         logger.warning(
                             f"{func.__name__} failed (attempt {attempt + 1}/{max_retries + 1}): {str(e)}. "
-                            f"Retrying in {current_delay:.1f}s..."
+                            f"Retrying in {sleep_for:.1f}s..."
                         )
-                        time.sleep(current_delay)
+                        time.sleep(sleep_for)
                         current_delay *= backoff_factor
                     else:
                         logger.error(
@@ -102,16 +130,16 @@ def log_execution_time(func: Callable) -> Callable:
     """
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         logger.info(f"Starting {func.__name__}...")
         
         try:
             result = func(*args, **kwargs)
-            elapsed = time.time() - start_time
+            elapsed = time.perf_counter() - start_time
             logger.info(f"{func.__name__} completed in {elapsed:.2f}s")
             return result
         except Exception as e:
-            elapsed = time.time() - start_time
+            elapsed = time.perf_counter() - start_time
             logger.error(f"{func.__name__} failed after {elapsed:.2f}s: {str(e)}")
             raise
     
@@ -128,23 +156,27 @@ def validate_inputs(**type_checks):
             pass
     """
     def decorator(func: Callable) -> Callable:
+        # Signature resolved once at decoration time - only bind() runs per call
+        sig = inspect.signature(func)
+        param_checks = tuple(
+            (name, expected_type) for name, expected_type in type_checks.items()
+            if name in sig.parameters
+        )
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # Get function signature
-            import inspect
-            sig = inspect.signature(func)
             bound_args = sig.bind(*args, **kwargs)
             bound_args.apply_defaults()
             
             # Validate types
-            for param_name, expected_type in type_checks.items():
-                if param_name in bound_args.arguments:
-                    value = bound_args.arguments[param_name]
-                    if not isinstance(value, expected_type):
-                        raise TypeError(
-                            f"{func.__name__}: Expected {param_name} to be {expected_type.__name__}, "
-                            f"got {type(value).__name__}"
-                        )
+            arguments = bound_args.arguments
+            for param_name, expected_type in param_checks:
+                value = arguments[param_name]
+                if not isinstance(value, expected_type):
+                    raise TypeError(
+                        f"{func.__name__}: Expected {param_name} to be {expected_type.__name__}, "
+                        f"got {type(value).__name__}"
+                    )
             
             return func(*args, **kwargs)
         
@@ -7,7 +7,7 @@ import pandas as pd
 import os
 from typing import Dict, Any, List
 import logging
-import json
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -126,8 +126,8 @@ Return JSON with: {{"delimiter": "...", "has_header": true/false, "num_columns":
         # Load first sheet by default
         df = pd.read_excel(filepath, sheet_name=sheet_names[0])
         
-        # Get sample to understand structure
-        sample = df.head(10).to_string()
+        # Get sample to understand structure (CSV avoids to_string's space padding, which costs tokens)
+        sample = df.head(10).to_csv(index=False)
         
         # Ask AI what this data represents
         prompt = f"""Analyze this Excel data and tell me what it contains:
@@ -248,7 +248,7 @@ class SmartReferenceDataMatcher:
                     temperature=0.3
                 )
                 
-                classification = json.loads(response.choices[0].message.content)
+                classification = orjson.loads(response.choices[0].message.content)
                 
                 if classification['classification'] != 'not_relevant' and classification['relevance_score'] > 20:
                     logger.info(f"📄 {filename}: {classification['classification']} (relevance: {classification['relevance_score']}%)")
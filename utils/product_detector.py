@@ -3,6 +3,8 @@
 Intelligent product detection using fuzzy matching and semantic similarity
 """
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Dict, List, Tuple
 import xml.etree.ElementTree as ET
 from difflib import SequenceMatcher
@@ -21,6 +23,7 @@ class SmartProductDetector:
     
     def __init__(self):
         self.product_definitions = self._load_product_definitions()
+        self._product_index = self._build_product_index(self.product_definitions)
     
     def _load_product_definitions(self) -> pd.DataFrame:
         """
@@ -74,6 +77,34 @@ class SmartProductDetector:
         
         return pd.DataFrame(definitions)
     
+    def _build_product_index(self, definitions: pd.DataFrame) -> List[Dict]:
+        """
+        Precompute per-product matching data once - lowercased patterns and the
+        normalization denominator - so detect_product does no per-call row boxing
+        or lowercasing of the definitions
+        """
+        index = []
+        for product in definitions.to_dict('records'):
+            keywords = tuple(product['keywords'])
+            node_patterns = tuple(p.lower() for p in product['node_patterns'])
+            attribute_patterns = tuple(p.lower() for p in product['attribute_patterns'])
+            index.append({
+                'product_code': product['product_code'],
+                'product_name': product['product_name'],
+                'code_lower': product['product_code'].lower(),
+                'keywords': keywords,
+                'node_patterns': node_patterns,
+                'attribute_patterns': attribute_patterns,
+                # Normalize score by number of possible matches
+                'max_possible_score': (
+                    len(keywords) * 1.0 +
+                    len(node_patterns) * 2.0 +
+                    len(attribute_patterns) * 1.5 +
+                    3.0
+                )
+            })
+        return index
+    
     def detect_product(self, xml_file, min_score: float = 0.2) -> Tuple[str, float, Dict]:
         """
         Intelligently detect product from XML using multiple signals
@@ -101,7 +132,7 @@ class SmartProductDetector:
             product_scores = {}
             detailed_scores = {}
             
-            for _, product in self.product_definitions.iterrows():
+            for product in self._product_index:
                 score = 0
                 details = {
                     'keyword_matches': 0,
@@ -117,8 +148,7 @@ class SmartProductDetector:
                         details['keyword_matches'] += 1
                 
                 # 2. Node pattern matching with fuzzy matching (weight: 2.0)
-                for pattern in product['node_patterns']:
-                    pattern_lower = pattern.lower()
+                for pattern_lower in product['node_patterns']:
                     # Exact match
                     if pattern_lower in all_nodes:
                         score += 2.0
@@ -134,8 +164,7 @@ class SmartProductDetector:
                                 break
                 
                 # 3. Attribute pattern matching (weight: 1.5)
-                for pattern in product['attribute_patterns']:
-                    pattern_lower = pattern.lower()
+                for pattern_lower in product['attribute_patterns']:
                     if pattern_lower in all_attributes:
                         score += 1.5
                         details['attribute_matches'] += 1
@@ -149,17 +178,10 @@ class SmartProductDetector:
                                 break
                 
                 # 4. Product name in XML (weight: 3.0)
-                if product['product_code'].lower() in xml_text:
+                if product['code_lower'] in xml_text:
                     score += 3.0
                 
-                # Normalize score by number of possible matches
-                max_possible_score = (
-                    len(product['keywords']) * 1.0 +
-                    len(product['node_patterns']) * 2.0 +
-                    len(product['attribute_patterns']) * 1.5 +
-                    3.0
-                )
-                
+                max_possible_score = product['max_possible_score']
                 normalized_score = score / max_possible_score if max_possible_score > 0 else 0
                 
                 product_scores[product['product_code']] = normalized_score
@@ -186,6 +208,24 @@ class SmartProductDetector:
             logger.error(f"Error detecting product: {str(e)}")
             return None, 0.0, {}
     
+    def detect_product_batch(self, xml_files: List, min_score: float = 0.2) -> List[Tuple[str, float, Dict]]:
+        """
+        Detect products for several XML files against the same product index
+        
+        Files are parsed on worker threads so reads overlap; results keep input order.
+        
+        Args:
+            xml_files: Paths to XML files or file-like objects
+            min_score: Minimum confidence score to return detection
+            
+        Returns:
+            List of (product_code, confidence_score, detailed_scores), one per file
+        """
+        if not xml_files:
+            return []
+        with ThreadPoolExecutor(max_workers=min(8, len(xml_files))) as executor:
+            return list(executor.map(partial(self.detect_product, min_score=min_score), xml_files))
+    
     def _fuzzy_match(self, str1: str, str2: str) -> float:
         """Calculate fuzzy string similarity (0-1)"""
         return SequenceMatcher(None, str1, str2).ratio()
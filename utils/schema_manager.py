@@ -3,21 +3,45 @@
 Dynamic schema management - fetches real-time schema from Snowflake
 """
 import pandas as pd
+import hashlib
 import logging
-from typing import Optional, List
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Seconds a fetched schema (or Silver table list) is reused before querying Snowflake again
+SCHEMA_CACHE_TTL = 3600
+
+# Full schemas fetched in this process, shared by every SchemaManager:
+# "database.schema" -> (fetch time, DataFrame)
+_SCHEMA_MEMO: Dict[str, Tuple[float, pd.DataFrame]] = {}
+
+# Schema columns that may be empty in the disk cache - read back as NaN, all others as ''
+_NULLABLE_CACHE_COLUMNS = ('column_default', 'max_length', 'numeric_precision', 'numeric_scale')
+
 
 class SchemaManager:
     """Dynamically fetch and manage database schemas"""
     
-    def __init__(self, snowflake_loader):
+    def __init__(self, snowflake_loader, cache_dir: Optional[str] = '.schema_cache', 
+                 cache_ttl: int = SCHEMA_CACHE_TTL):
+        """
+        Args:
+            snowflake_loader: Connected SnowflakeStageLoader
+            cache_dir: Directory for the on-disk schema cache (None disables it)
+            cache_ttl: Seconds a cached schema stays valid on disk
+        """
         self.sf_loader = snowflake_loader
-        self.schema_cache = {}
+        self.schema_cache = _SCHEMA_MEMO
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_ttl = cache_ttl
     
     def get_silver_schema(self, database: str = 'INSURANCE', schema: str = 'SILVER', 
-                         tables: Optional[List[str]] = None) -> pd.DataFrame:
+                         tables: Optional[List[str]] = None, refresh: bool = False) -> pd.DataFrame:
         """
         Fetch actual Silver layer schema from Snowflake at runtime
         
@@ -25,17 +49,27 @@ class SchemaManager:
             database: Database name
             schema: Schema name
             tables: Optional list of specific tables to fetch. If None, fetches all.
+            refresh: Skip the process and disk caches and query Snowflake
         
         Returns:
             DataFrame with columns: table_name, column_name, data_type, description, 
                                    is_nullable, column_default, ordinal_position
         """
-        cache_key = f"{database}.{schema}"
+        # Scoped to the connection's account/role/user, like the disk cache - the same
+        # database name elsewhere, or another role's view of it, is a different schema
+        cache_key = f"{database}.{schema}.{self._identity_digest()}"
         
-        # Check cache first (optional - can remove for always-fresh data)
-        if cache_key in self.schema_cache:
-            logger.info(f"Using cached schema for {cache_key}")
-            cached_df = self.schema_cache[cache_key]
+        # Check the process-wide cache first, then the on-disk cache shared across runs
+        cached_df = None if refresh else self._load_memo(cache_key)
+        if cached_df is not None:
+            logger.info(f"Using cached schema for {database}.{schema}")
+        elif not refresh:
+            cached_df = self._load_disk_cache(database, schema)
+            if cached_df is not None:
+                logger.info(f"Using disk-cached schema for {database}.{schema}")
+                self.schema_cache[cache_key] = (time.time(), cached_df)
+        
+        if cached_df is not None:
             if tables:
                 return cached_df[cached_df['table_name'].str.upper().isin([t.upper() for t in tables])]
             return cached_df
@@ -91,8 +125,11 @@ class SchemaManager:
             
             logger.info(f"✅ Fetched {len(schema_df)} columns from {len(schema_df['table_name'].unique())} tables")
             
-            # Cache the result
-            self.schema_cache[cache_key] = schema_df
+            # Cache the result (only full-schema fetches, so a filtered fetch never
+            # stands in for the whole schema)
+            if not tables:
+                self.schema_cache[cache_key] = (time.time(), schema_df)
+                self._save_disk_cache(database, schema, schema_df)
             
             return schema_df
             
@@ -101,6 +138,69 @@ class SchemaManager:
             logger.warning("Falling back to sample schema")
             return self._get_fallback_schema()
     
+    def _load_memo(self, cache_key: str) -> Optional[pd.DataFrame]:
+        """Return the schema fetched earlier in this process if younger than cache_ttl"""
+        entry = self.schema_cache.get(cache_key)
+        if entry is None:
+            return None
+        fetched_at, schema_df = entry
+        if time.time() - fetched_at > self.cache_ttl:
+            # pop - another worker thread may have evicted it already
+            self.schema_cache.pop(cache_key, None)
+            return None
+        return schema_df
+    
+    def _identity_digest(self) -> str:
+        """Short hash of the connection's account, role and user - part of every cache key"""
+        conn = self.sf_loader.conn
+        identity = '\0'.join(str(getattr(conn, attr, None) or '') for attr in ('account', 'role', 'user'))
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+    
+    def _disk_cache_path(self, database: str, schema: str) -> Path:
+        """
+        Path of the cached schema for database.schema as seen by this connection
+        
+        The account, role and user are hashed into the name - the same database name on
+        another account, or under a role that sees other columns, gets its own file.
+        """
+        return self.cache_dir / f"silver_{database}_{schema}_{self._identity_digest()}.csv"
+    
+    def _load_disk_cache(self, database: str, schema: str) -> Optional[pd.DataFrame]:
+        """Return the cached schema if present and younger than cache_ttl"""
+        if not self.cache_dir:
+            return None
+        
+        path = self._disk_cache_path(database, schema)
+        try:
+            if not path.exists() or time.time() - path.stat().st_mtime > self.cache_ttl:
+                return None
+            return pd.read_csv(path, keep_default_na=False,
+                               na_values={column: [''] for column in _NULLABLE_CACHE_COLUMNS})
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable schema cache {path}: {str(e)}")
+            return None
+    
+    def _save_disk_cache(self, database: str, schema: str, schema_df: pd.DataFrame):
+        """Persist a fetched schema for later runs"""
+        if not self.cache_dir:
+            return
+        
+        tmp_path = None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Written beside the cache file and renamed into place, so a concurrent reader
+            # or a crash mid-write never leaves a truncated schema behind
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+                schema_df.to_csv(f, index=False)
+            os.replace(tmp_path, self._disk_cache_path(database, schema))
+            tmp_path = None
+        except Exception as e:
+            logger.warning(f"Could not write schema cache: {str(e)}")
+        finally:
+            if tmp_path is not None:
+                Path(tmp_path).unlink(missing_ok=True)
+    
     def _format_data_type(self, row):
         """Format data type with precision/scale/length"""
         dtype = row['data_type']
@@ -153,4 +253,7 @@ class SchemaManager:
     def refresh_schema(self):
         """Clear cache and force refresh on next fetch"""
         self.schema_cache.clear()
+        if self.cache_dir and self.cache_dir.exists():
+            for path in self.cache_dir.glob('silver_*.csv'):
+                path.unlink(missing_ok=True)
         logger.info("Schema cache cleared")